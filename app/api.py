@@ -0,0 +1,193 @@
+from flask import Blueprint, current_app, jsonify, request, session
+from functools import wraps
+from typing import Tuple
+
+# JSON API поверх UserManager для интеграций: те же операции, что и в HTML-страницах,
+# но без редиректов и перерисовки страниц. Авторизация — та же сессия, что и у сайта.
+# Сами операции — обычные функции (user_manager, email, ...) -> (ответ, статус),
+# их же вызывает асинхронный режим (asgi.py); здесь только разбор запроса Flask.
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+Result = Tuple[dict, int]
+
+
+def manager():
+    return current_app.extensions['user_manager']
+
+
+def error(message: str, status: int):
+    return jsonify({"error": message}), status
+
+
+def login_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        email = session.get('email')
+        user = manager().get_user(email) if email else None
+        if user is None:
+            return error("not authenticated", 401)
+        return view(user.email, *args, **kwargs)
+    return wrapper
+
+
+def task_json(task):
+    return None if task is None else task.to_dict()
+
+
+def request_json() -> dict:
+    data = request.get_json(silent=True)
+    return data if isinstance(data, dict) else {}
+
+
+def page_args():
+    limit = request.args.get('limit', current_app.config['PAGE_SIZE'], type=int)
+    return max(1, min(limit, current_app.config['MAX_PAGE_SIZE'])), request.args.get('cursor')
+
+
+def check_login(user_manager, data: dict):
+    """Пользователь с логином и паролем из тела запроса или None"""
+    return user_manager.login_user(str(data.get('email_or_phone', '')).strip(), str(data.get('password', '')).strip())
+
+
+@api.route('/login', methods=['POST'])
+def login():
+    user = check_login(manager(), request_json())
+    if not user:
+        return error("invalid credentials", 401)
+    session.regenerate()
+    session['email'] = user.email
+    return jsonify({"name": user.name, "email": user.email})
+
+
+def tasks_page(user_manager, email: str, filter_type: str, limit: int, cursor: str, query: str) -> dict:
+    tasks = user_manager.get_tasks(email, filter_type, limit + 1, cursor, query)
+    next_cursor = None
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        next_cursor = user_manager.task_cursor(email, filter_type, tasks[-1])
+    return {"tasks": [task.to_dict() for task in tasks], "next_cursor": next_cursor,
+            "counts": user_manager.get_counts(email)}
+
+
+@api.route('/tasks', methods=['GET'])
+@login_required
+def list_tasks(email):
+    limit, cursor = page_args()
+    return jsonify(tasks_page(manager(), email, request.args.get('filter', 'all'), limit, cursor,
+                              request.args.get('q', '').strip()))
+
+
+def create_task_result(user_manager, email: str, data: dict) -> Result:
+    task = user_manager.add_task(email, str(data.get('text', '')).strip(), data.get('due_date') or None)
+    if task is None:
+        return {"error": "task text is required"}, 400
+    return {"task": task.to_dict()}, 201
+
+
+@api.route('/tasks', methods=['POST'])
+@login_required
+def create_task(email):
+    return create_task_result(manager(), email, request_json())
+
+
+def toggle_task_result(user_manager, email: str, task_id: str) -> Result:
+    if not user_manager.toggle_task_status(email, task_id):
+        return {"error": "task not found"}, 404
+    return {"task": task_json(user_manager.get_task(email, task_id))}, 200
+
+
+@api.route('/tasks/<task_id>/toggle', methods=['POST'])
+@login_required
+def toggle_task(email, task_id):
+    return toggle_task_result(manager(), email, task_id)
+
+
+def delete_task_result(user_manager, email: str, task_id: str) -> Result:
+    if not user_manager.delete_task(email, task_id):
+        return {"error": "task not found"}, 404
+    return {"deleted": task_id}, 200
+
+
+@api.route('/tasks/<task_id>', methods=['DELETE'])
+@login_required
+def delete_task(email, task_id):
+    return delete_task_result(manager(), email, task_id)
+
+
+def trash_page(user_manager, email: str, limit: int, cursor: str) -> dict:
+    tasks = user_manager.get_trash(email, limit + 1, cursor)
+    next_cursor = None
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        next_cursor = user_manager.trash_cursor(email, tasks[-1])
+    return {"tasks": [task.to_dict() for task in tasks], "next_cursor": next_cursor}
+
+
+@api.route('/trash', methods=['GET'])
+@login_required
+def list_trash(email):
+    return jsonify(trash_page(manager(), email, *page_args()))
+
+
+def restore_task_result(user_manager, email: str, task_id: str) -> Result:
+    if not user_manager.restore_task(email, task_id):
+        return {"error": "task not found"}, 404
+    return {"task": task_json(user_manager.get_task(email, task_id))}, 200
+
+
+@api.route('/trash/<task_id>/restore', methods=['POST'])
+@login_required
+def restore_task(email, task_id):
+    return restore_task_result(manager(), email, task_id)
+
+
+def empty_trash_result(user_manager, email: str) -> Result:
+    return {"emptied": user_manager.empty_trash(email)}, 200
+
+
+@api.route('/trash', methods=['DELETE'])
+@login_required
+def empty_trash(email):
+    return empty_trash_result(manager(), email)
+
+
+def apply_operation(user_manager, email: str, operation: dict) -> dict:
+    if not isinstance(operation, dict):
+        return {"ok": False, "error": "operation must be an object"}
+    op = operation.get('op')
+    task_id = operation.get('id')
+    if op in ('toggle', 'delete', 'restore') and not isinstance(task_id, str):
+        return {"ok": False, "error": "id must be a string"}
+    if op == 'add':
+        task = user_manager.add_task(email, str(operation.get('text', '')).strip(), operation.get('due_date') or None)
+        return {"ok": task is not None, "task": task_json(task)}
+    if op == 'toggle':
+        ok = user_manager.toggle_task_status(email, task_id)
+        return {"ok": ok, "task": task_json(user_manager.get_task(email, task_id)) if ok else None}
+    if op == 'delete':
+        return {"ok": user_manager.delete_task(email, task_id)}
+    if op == 'restore':
+        return {"ok": user_manager.restore_task(email, task_id)}
+    if op == 'empty_trash':
+        return {"ok": user_manager.empty_trash(email)}
+    return {"ok": False, "error": f"unknown op: {op}"}
+
+
+def apply_batch(user_manager, email: str, operations: list) -> list:
+    with user_manager.batch():
+        return [apply_operation(user_manager, email, operation) for operation in operations]
+
+
+def batch_result(user_manager, email: str, data: dict) -> Result:
+    """Применяет список операций {"op": add|toggle|delete|restore|empty_trash, ...}
+    и сохраняет результат один раз."""
+    operations = data.get('operations')
+    if not isinstance(operations, list):
+        return {"error": "operations must be a list"}, 400
+    return {"results": apply_batch(user_manager, email, operations)}, 200
+
+
+@api.route('/batch', methods=['POST'])
+@login_required
+def batch(email):
+    return batch_result(manager(), email, request_json())
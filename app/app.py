@@ -1,9 +1,24 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, render_template, request, redirect, url_for, session, flash, make_response
+import hashlib
 import json
+import logging
 import os
-import re
-from datetime import datetime
-from typing import List, Dict, Union
+import secrets
+import threading
+import time
+from datetime import date, datetime
+from itertools import islice
+from typing import Iterable, List, Dict, Optional, Tuple, Union
+from storage import Storage, JsonStorage, JournaledJsonStorage, ShardedJsonStorage, SqliteStorage, new_task_id
+from indexes import OrderIndex, TaskIndex, created_key, deleted_key
+from records import (Task, User, is_email_valid, is_name_valid, is_password_valid, is_phone_valid, now_seconds,
+                     parse_due_day)
+from cache import LRUCache
+from sessions import FileSessionStore, MemorySessionStore, ServerSessionInterface, SqliteSessionStore
+import metrics
+from api import api
+
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key_here'
@@ -11,37 +26,163 @@ app.secret_key = 'your_secret_key_here'
 DB_FILE = "users.json"
 TASKS_FILE = "users_tasks.json"
 TRASH_FILE = "users_trash.json"
+SQLITE_FILE = "users.db"
+JOURNAL_FILE = "users_journal.jsonl"
+SHARDS_DIR = "users_shards"
+TASKS_SNAPSHOT = "users_tasks.bin"
+TRASH_SNAPSHOT = "users_trash.bin"
+# json — три JSON-файла, journal — JSON-файлы с журналом изменений,
+# sharded — отдельный JSON-файл задач на пользователя (задачи из
+# TASKS_FILE и TRASH_FILE переносятся при первом запуске),
+# sqlite — база SQLite (перенос данных: python storage.py)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "json")
+# Формат задач и корзины для json: json или binary — компактные снимки
+# TASKS_SNAPSHOT и TRASH_SNAPSHOT (перенос: python snapshot.py import)
+SNAPSHOT_FORMAT = os.environ.get("SNAPSHOT_FORMAT", "json")
+# json: сохранять изменения не чаще раза в FLUSH_INTERVAL_MS миллисекунд (0 — сразу)
+FLUSH_INTERVAL_MS = int(os.environ.get("FLUSH_INTERVAL_MS", "0"))
+# Что сбрасывать на диск при сохранении: none, file — файлы, full — файлы и папку;
+# для journal любое значение, кроме none, включает fsync журнала
+DURABILITY = os.environ.get("DURABILITY", "none")
+# Где хранятся сессии: memory — в памяти процесса (при нескольких процессах
+# нужен file или sqlite), file — файл на сессию в SESSIONS_DIR, sqlite — SESSIONS_DB
+SESSION_STORE = os.environ.get("SESSION_STORE", "memory")
+SESSIONS_DIR = "sessions"
+SESSIONS_DB = "sessions.db"
+# Как часто удалять истёкшие сессии, секунд
+SESSION_SWEEP_INTERVAL = 600
+# Сколько пользователей sharded держит в памяти
+MAX_LOADED_USERS = 1000
+# Задача срочная, если до срока осталось не больше URGENT_DAYS дней
+URGENT_DAYS = 3
+# Фильтры списка задач; get_tasks считает любой другой фильтр за all
+TASK_FILTERS = ("all", "active", "completed", "urgent", "overdue", "search")
+# Сколько задач показывать на одной странице /tasks и /trash
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+# Сколько отрисованных списков задач и корзин держать в кэше
+FRAGMENT_CACHE_SIZE = 1024
+# Срок хранения корзины: задачи, удалённые больше TRASH_MAX_AGE_DAYS дней назад,
+# и самые старые сверх TRASH_MAX_ITEMS на пользователя удаляются насовсем
+# фоновым потоком раз в TRASH_SWEEP_INTERVAL секунд (0 — без ограничения)
+TRASH_MAX_AGE_DAYS = int(os.environ.get("TRASH_MAX_AGE_DAYS", "0"))
+TRASH_MAX_ITEMS = int(os.environ.get("TRASH_MAX_ITEMS", "0"))
+TRASH_SWEEP_INTERVAL = 3600
+# Сколько пользователей очищается за одно сохранение хранилища
+TRASH_SWEEP_BATCH = 100
+
+def create_storage(backend: str = STORAGE_BACKEND) -> Storage:
+    if backend == "sqlite":
+        return SqliteStorage(SQLITE_FILE)
+    if backend == "journal":
+        return JournaledJsonStorage(DB_FILE, TASKS_FILE, TRASH_FILE, JOURNAL_FILE, fsync=DURABILITY != "none")
+    if backend == "sharded":
+        return ShardedJsonStorage(DB_FILE, SHARDS_DIR, MAX_LOADED_USERS, TASKS_FILE, TRASH_FILE)
+    options = {"flush_interval": FLUSH_INTERVAL_MS / 1000, "durability": DURABILITY}
+    if SNAPSHOT_FORMAT == "binary":
+        return JsonStorage(DB_FILE, TASKS_SNAPSHOT, TRASH_SNAPSHOT, binary=True, **options)
+    return JsonStorage(DB_FILE, TASKS_FILE, TRASH_FILE, **options)
+
+def create_session_store(store: str = SESSION_STORE):
+    if store == "sqlite":
+        return SqliteSessionStore(SESSIONS_DB)
+    if store == "file":
+        return FileSessionStore(SESSIONS_DIR)
+    return MemorySessionStore()
 
 class UserManager:
-    def __init__(self):
-        self.users = self._load_data(DB_FILE, default=[])
-        self.tasks = self._load_data(TASKS_FILE)
-        self.trash = self._load_data(TRASH_FILE)
-
-    def _load_data(self, filename: str, default=None):
-        if default is None:
-            default = {} if filename != DB_FILE else []
-        try:
-            with open(filename, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return default
-
-    def _save_data(self, data, filename: str):
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+    """Данные пользователей и задач в памяти поверх хранилища.
+
+    Методы безопасны для вызова из нескольких потоков и процессов:
+    чтение идёт внутри storage.read(email), изменения — внутри
+    storage.write(email), а изменения других процессов приходят
+    через _on_storage_change.
+
+    Каждое изменение задач или корзины пользователя меняет его версию
+    (get_version), по ней страницы проверяют, изменилось ли что-нибудь.
+
+    Задача в корзине помнит время удаления (Task.deleted); корзина
+    упорядочена по нему, поэтому самые старые задачи — её начало.
+    trash_max_age_days и trash_max_items (0 — без ограничения) соблюдает
+    sweep_trash, её вызывает фоновый поток start_trash_sweeper.
+    """
+
+    def __init__(self, storage: Storage = None, trash_max_age_days: int = TRASH_MAX_AGE_DAYS,
+                 trash_max_items: int = TRASH_MAX_ITEMS):
+        self.storage = storage or create_storage()
+        self.trash_max_age_days = trash_max_age_days
+        self.trash_max_items = trash_max_items
+        self.trash_sweeper: Optional[threading.Thread] = None
+        self.users, self.tasks, self.trash = self.storage.load()
+        # Индексы для входа и проверки дубликатов за O(1)
+        self.users_by_email: Dict[str, User] = {}
+        self.users_by_phone: Dict[str, User] = {}
+        for user in self.users:
+            self._index_user(user)
+        # Индексы по задачам строятся при первом обращении к задачам пользователя
+        self.task_indexes: Dict[str, TaskIndex] = {}
+        self.trash_orders: Dict[str, OrderIndex] = {}
+        # Версии задач пользователей. Счётчики у каждого процесса свои, поэтому
+        # в версию входит случайный признак экземпляра; epoch меняется, когда
+        # перечитаны задачи всех пользователей
+        self.instance = secrets.token_hex(4)
+        self.epoch = 0
+        self.versions: Dict[str, int] = {}
+        self.storage.on_change = self._on_storage_change
+
+    def _on_storage_change(self, emails, users):
+        """Хранилище подхватило изменения другого процесса: индексы устарели"""
+        if users is None:
+            self.users_by_email.clear()
+            self.users_by_phone.clear()
+            users = self.users
+        for user in users:
+            self._index_user(user)
+        if emails is None:
+            self.task_indexes.clear()
+            self.trash_orders.clear()
+            self.epoch += 1
+            return
+        for email in emails:
+            self.task_indexes.pop(email, None)
+            self.trash_orders.pop(email, None)
+            self._bump_version(email)
+
+    def _bump_version(self, email: str):
+        self.versions[email] = self.versions.get(email, 0) + 1
+
+    def get_version(self, email: str) -> str:
+        """Версия задач и корзины пользователя: меняется при каждом их изменении"""
+        with self.storage.read(email):
+            return f"{self.instance}.{self.epoch}.{self.versions.get(email, 0)}"
+
+    def _index_user(self, user: User):
+        self.users_by_email[user.email] = user
+        self.users_by_phone[user.phone] = user
+
+    def _task_index(self, email: str) -> TaskIndex:
+        index = self.task_indexes.get(email)
+        if index is None:
+            index = self.task_indexes[email] = TaskIndex(self.tasks.get(email, {}))
+        return index
+
+    def _trash_order(self, email: str) -> OrderIndex:
+        order = self.trash_orders.get(email)
+        if order is None:
+            order = self.trash_orders[email] = OrderIndex(map(deleted_key, self.trash.get(email, {}).values()))
+        return order
 
     def _is_email_valid(self, email: str) -> bool:
-        return re.match(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9-]+\.[a-zA-Z]{2,}$", email) is not None
+        return is_email_valid(email)
 
     def _is_phone_valid(self, phone: str) -> bool:
-        return (re.match(r"^8\d{10}$", phone) is not None) or (re.match(r"^\+7\d{10}$", phone) is not None)
+        return is_phone_valid(phone)
 
     def _is_password_valid(self, password: str) -> bool:
-        return len(password) >= 5 and password.isalpha()
+        return is_password_valid(password)
 
     def _is_name_valid(self, name: str) -> bool:
-        return re.match(r"^[^!@#$%^&*()_+=-]*$", name) is not None
+        return is_name_valid(name)
 
     def register_user(self, user_data: Dict[str, str]) -> bool:
         if not all([
@@ -52,132 +193,365 @@ class UserManager:
         ]):
             return False
 
-        if any(u["email"] == user_data["email"] for u in self.users):
-            return False
-        if any(u["phone"] == user_data["phone"] for u in self.users):
-            return False
+        with self.storage.write(None):
+            if user_data["email"] in self.users_by_email:
+                return False
+            if user_data["phone"] in self.users_by_phone:
+                return False
 
-        self.users.append(user_data)
-        self._save_data(self.users, DB_FILE)
+            user = User.from_dict(user_data)
+            self.users.append(user)
+            self._index_user(user)
+            self.storage.add_user(user)
         return True
 
-    def login_user(self, email_or_phone: str, password: str) -> Union[Dict[str, str], None]:
-        for user in self.users:
-            if (user["email"] == email_or_phone or user["phone"] == email_or_phone) and user["password"] == password:
-                if user['email'] not in self.tasks:
-                    self.tasks[user['email']] = []
-                    self._save_data(self.tasks, TASKS_FILE)
-                return user
-        return None
-
-    def add_task(self, email: str, task_text: str, due_date: str = None) -> bool:
+    def find_user(self, email_or_phone: str) -> Union[User, None]:
+        with self.storage.read(None):
+            return self.users_by_email.get(email_or_phone) or self.users_by_phone.get(email_or_phone)
+
+    def login_user(self, email_or_phone: str, password: str) -> Union[User, None]:
+        user = self.find_user(email_or_phone)
+        if user is None or user.password != password:
+            return None
+        if user.email not in self.tasks:
+            with self.storage.write(user.email):
+                if user.email not in self.tasks:
+                    self.tasks[user.email] = {}
+                    self.storage.ensure_user(user.email)
+        return user
+
+    def get_user(self, email: str) -> Union[User, None]:
+        with self.storage.read(None):
+            return self.users_by_email.get(email)
+
+    def batch(self):
+        """Изменения внутри блока `with user_manager.batch():` сохраняются один раз в конце"""
+        return self.storage.batch()
+
+    def import_users(self, users: List[User]) -> int:
+        """Добавляет уже проверенных пользователей (bulk.py); пользователи с занятым
+        email или телефоном пропускаются. Возвращает число добавленных."""
+        added = 0
+        with self.storage.write(None):
+            for user in users:
+                if user.email in self.users_by_email or user.phone in self.users_by_phone:
+                    continue
+                self.users.append(user)
+                self._index_user(user)
+                self.storage.add_user(user)
+                added += 1
+        return added
+
+    def import_tasks(self, email: str, tasks: List[Task], trash: bool = False) -> int:
+        """Добавляет готовые задачи с их id, временем создания и сроком — в список задач
+        или, с trash=True, в корзину. Задачам без id присваивается новый, без времени
+        создания — текущее, как в add_task; время удаления у задач корзины не
+        подставляется. Задачи с уже существующим у пользователя id пропускаются. Корзина упорядочена по времени удаления, поэтому импортированные
+        задачи встают в ней на своё место. Возвращает число добавленных."""
+        added = 0
+        now = now_seconds()
+        with self.storage.write(email):
+            user_tasks = self.tasks.setdefault(email, {})
+            user_trash = self.trash.setdefault(email, {})
+            index = self._task_index(email)
+            trash_order = self._trash_order(email)
+            for task in tasks:
+                if task.id is None:
+                    task.id = new_task_id()
+                elif task.id in user_tasks or task.id in user_trash:
+                    continue
+                if task.created is None:
+                    task.created = now
+                self.storage.add_task(email, task)
+                if trash:
+                    # Без отметки удаления задача так и остаётся без неё, как удалённые
+                    # до её появления: время импорта — не время удаления
+                    user_trash[task.id] = task
+                    trash_order.add(deleted_key(task))
+                    self.storage.delete_task(email, task)
+                else:
+                    user_tasks[task.id] = task
+                    index.add(task)
+                added += 1
+            if added:
+                self._bump_version(email)
+        return added
+
+    def export_tasks(self, email: str) -> Tuple[List[Task], List[Task]]:
+        """Задачи и корзина пользователя для выгрузки; задачи, которые ещё
+        не читались, читаются из хранилища и в памяти не остаются"""
+        return self.storage.peek_user(email)
+
+    def add_task(self, email: str, task_text: str, due_date: str = None) -> Union[Task, None]:
+        """Возвращает созданную задачу или None, если текст пустой.
+
+        due_date — срок "YYYY-MM-DD"; срок в другом формате не сохраняется.
+        """
         if not task_text:
-            return False
+            return None
             
-        new_task = {
-            "text": task_text,
-            "completed": False,
-            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "due_date": due_date  # Добавляем срок выполнения
-        }
+        new_task = Task(new_task_id(), task_text, False, now_seconds(), parse_due_day(due_date))
         
-        if email not in self.tasks:
-            self.tasks[email] = []
-        
-        self.tasks[email].append(new_task)
-        self._save_data(self.tasks, TASKS_FILE)
-        return True
-
-    def is_task_urgent(self, task: Dict) -> bool:
+        with self.storage.write(email):
+            if email not in self.tasks:
+                self.tasks[email] = {}
+
+            index = self._task_index(email)
+            self.tasks[email][new_task.id] = new_task
+            index.add(new_task)
+            self._bump_version(email)
+            self.storage.add_task(email, new_task)
+        return new_task
+
+    def is_task_urgent(self, task: Task) -> bool:
         """Проверяет, является ли задача срочной (осталось <= 3 дня)"""
-        if not task.get('due_date'):
-            return False
-        try:
-            due_date = datetime.strptime(task['due_date'], "%Y-%m-%d")
-            days_left = (due_date - datetime.now()).days
-            return 0 <= days_left <= 3
-        except:
-            return False
+        return task.due_day is not None and 0 <= task.due_day - date.today().toordinal() <= URGENT_DAYS
 
-    def is_task_overdue(self, task: Dict) -> bool:
+    def is_task_overdue(self, task: Task) -> bool:
         """Проверяет, просрочена ли задача"""
-        if not task.get('due_date'):
-            return False
+        return task.due_day is not None and task.due_day < date.today().toordinal()
+
+    def get_tasks(self, email: str, filter_type: str = "all", limit: int = None, cursor: str = None,
+                  query: str = None) -> List[Task]:
+        """Срочные и просроченные задачи возвращаются по возрастанию срока, остальные — по времени создания.
+
+        filter_type="search" — задачи, в тексте которых есть слова, начинающиеся
+        со слов query (без учёта регистра, ё и е не различаются).
+        limit ограничивает число задач, cursor — значение task_cursor() для
+        последней полученной задачи: выдача продолжится сразу после неё.
+        Курсор составлен из сохраняемых полей задачи, поэтому его понимает
+        любой процесс и его не сдвигают добавленные и удалённые задачи.
+        """
+        if filter_type not in TASK_FILTERS:
+            # Фильтр приходит из запроса: в метки метрик попадают только известные
+            filter_type = "all"
+        with self.storage.read(email):
+            if email not in self.tasks:
+                return []
+
+            user_tasks = self.tasks[email]
+            index = self._task_index(email)
+            if filter_type in ("urgent", "overdue"):
+                # Срочные включают просроченные: это все невыполненные со сроком до today + URGENT_DAYS
+                today = date.today().toordinal()
+                last_day = today + URGENT_DAYS if filter_type == "urgent" else today - 1
+                task_ids = (task_id for _, task_id in index.due.iter_until(last_day, self._parse_cursor(cursor)))
+            elif filter_type == "search":
+                task_ids = index.search(user_tasks, query or "", self._parse_cursor(cursor))
+            else:
+                task_ids = (task_id for _, task_id in index.order.after(self._parse_cursor(cursor)))
+            if metrics.ENABLED:
+                task_ids = scanned = metrics.Tally(task_ids)
+            found = map(user_tasks.__getitem__, task_ids)
+            if filter_type == "active":
+                found = (task for task in found if not task.completed)
+            elif filter_type == "completed":
+                found = (task for task in found if task.completed)
+            result = list(islice(found, limit))
+            if metrics.ENABLED:
+                metrics.registry.observe("get_tasks_scanned_tasks", scanned.count, filter=filter_type)
+            return result
+
+    def get_task(self, email: str, task_id: str) -> Union[Task, None]:
+        with self.storage.read(email):
+            return self.tasks.get(email, {}).get(task_id)
+
+    def task_cursor(self, email: str, filter_type: str, task: Task) -> str:
+        """Курсор, с которого get_tasks продолжит выдачу после task"""
+        if filter_type in ("urgent", "overdue"):
+            return f"{task.due_day}:{task.id}"
+        created, task_id = created_key(task)
+        return f"{created}:{task_id}"
+
+    def _parse_cursor(self, cursor: str):
+        """Курсор вида "число:id" как (число, id); None, если он не такой"""
         try:
-            due_date = datetime.strptime(task['due_date'], "%Y-%m-%d")
-            return (due_date - datetime.now()).days < 0
-        except:
-            return False
+            number, task_id = cursor.split(":", 1)
+            return int(number), task_id
+        except (AttributeError, ValueError):
+            return None
+
+    def get_counts(self, email: str) -> Dict[str, int]:
+        """Количество задач для каждого фильтра и размер корзины"""
+        with self.storage.read(email):
+            counts = self._task_index(email).counts(date.today().toordinal(), URGENT_DAYS)
+            counts["trash"] = len(self.trash.get(email, {}))
+        return counts
+
+    def get_days_left(self, email: str, tasks: List[Task]) -> Dict[str, int]:
+        """Сколько дней осталось до срока: {id: дни}, для задач без срока значения нет"""
+        today = date.today().toordinal()
+        days_left = {}
+        with self.storage.read(email):
+            index = self._task_index(email)
+            for task in tasks:
+                days = index.days_left(task.id, today)
+                if days is not None:
+                    days_left[task.id] = days
+        return days_left
+
+    def get_trash(self, email: str, limit: int = None, cursor: str = None) -> List[Task]:
+        """Задачи в корзине по времени удаления; limit и cursor — как в get_tasks"""
+        with self.storage.read(email):
+            user_trash = self.trash.get(email, {})
+            entries = self._trash_order(email).after(self._parse_cursor(cursor))
+            return list(islice((user_trash[task_id] for _, task_id in entries), limit))
+
+    def trash_cursor(self, email: str, task: Task) -> str:
+        deleted, task_id = deleted_key(task)
+        return f"{deleted}:{task_id}"
+
+    def toggle_task_status(self, email: str, task_id: str) -> bool:
+        with self.storage.write(email):
+            task = self.tasks.get(email, {}).get(task_id)
+            if task is None:
+                return False
+            index = self._task_index(email)
+            task.completed = not task.completed
+            index.set_completed(task)
+            self._bump_version(email)
+            self.storage.update_task(email, task)
+        return True
 
-    def get_tasks(self, email: str, filter_type: str = "all") -> List[Dict]:
-        if email not in self.tasks:
-            return []
-        
-        if filter_type == "active":
-            return [task for task in self.tasks[email] if not task['completed']]
-        elif filter_type == "completed":
-            return [task for task in self.tasks[email] if task['completed']]
-        elif filter_type == "urgent":
-            return [task for task in self.tasks[email] if not task['completed'] and 
-               (self.is_task_urgent(task) or self.is_task_overdue(task))]
-        elif filter_type == "overdue":
-            return [task for task in self.tasks[email] if not task['completed'] and 
-               self.is_task_overdue(task)]
-        else:
-            return self.tasks[email]
+    def delete_task(self, email: str, task_id: str) -> bool:
+        with self.storage.write(email):
+            index = self._task_index(email)
+            task_to_delete = self.tasks.get(email, {}).pop(task_id, None)
+            if task_to_delete is None:
+                return False
+            index.remove(task_to_delete)
+            task_to_delete.deleted = now_seconds()
+            trash_order = self._trash_order(email)
+            self.trash.setdefault(email, {})[task_id] = task_to_delete
+            trash_order.add(deleted_key(task_to_delete))
+            self._bump_version(email)
+            self.storage.delete_task(email, task_to_delete)
+        return True
 
-    def toggle_task_status(self, email: str, task_text: str) -> bool:
-        for task in self.tasks.get(email, []):
-            if task['text'] == task_text:
-                task['completed'] = not task['completed']
-                self._save_data(self.tasks, TASKS_FILE)
-                return True
-        return False
+    def restore_task(self, email: str, task_id: str) -> bool:
+        with self.storage.write(email):
+            trash_order = self._trash_order(email)
+            task_to_restore = self.trash.get(email, {}).pop(task_id, None)
+            if task_to_restore is None:
+                return False
+            trash_order.remove(deleted_key(task_to_restore))
+            task_to_restore.deleted = None
+            index = self._task_index(email)
+            self.tasks.setdefault(email, {})[task_id] = task_to_restore
+            index.add(task_to_restore)
+            self._bump_version(email)
+            self.storage.restore_task(email, task_to_restore)
+        return True
 
-    def delete_task(self, email: str, task_text: str) -> bool:
-        task_to_delete = None
-        for task in self.tasks.get(email, []):
-            if task['text'] == task_text:
-                task_to_delete = task
-                break
-        
-        if task_to_delete:
-            self.tasks[email].remove(task_to_delete)
-            if email not in self.trash:
-                self.trash[email] = []
-            self.trash[email].append(task_to_delete)
-            self._save_data(self.tasks, TASKS_FILE)
-            self._save_data(self.trash, TRASH_FILE)
-            return True
+    def empty_trash(self, email: str) -> bool:
+        with self.storage.write(email):
+            if email in self.trash and len(self.trash[email]) > 0:
+                self.trash[email] = {}
+                self._trash_order(email).clear()
+                self._bump_version(email)
+                self.storage.empty_trash(email)
+                return True
         return False
 
-    def restore_task(self, email: str, task_text: str) -> bool:
-        task_to_restore = None
-        for task in self.trash.get(email, []):
-            if task['text'] == task_text:
-                task_to_restore = task
+    def _expired_trash(self, trash: Iterable[Task], count: int, cutoff: Optional[int]) -> List[Task]:
+        """Задачи корзины из count задач (в порядке удаления), которые пора удалить насовсем"""
+        excess = count - self.trash_max_items if self.trash_max_items else 0
+        expired = []
+        for task in trash:
+            if len(expired) < excess:
+                expired.append(task)
+            elif task.deleted is None:
+                # Удалена до появления отметки времени: ограничивает её только число задач
+                continue
+            elif cutoff is not None and task.deleted < cutoff:
+                expired.append(task)
+            else:
                 break
-        
-        if task_to_restore:
-            self.trash[email].remove(task_to_restore)
-            self.tasks[email].append(task_to_restore)
-            self._save_data(self.tasks, TASKS_FILE)
-            self._save_data(self.trash, TRASH_FILE)
-            return True
-        return False
-
-    def empty_trash(self, email: str) -> bool:
-        if email in self.trash and len(self.trash[email]) > 0:
-            self.trash[email] = []
-            self._save_data(self.trash, TRASH_FILE)
-            return True
-        return False
+        return expired
+
+    def purge_trash(self, email: str, cutoff: Optional[int] = None) -> int:
+        """Удаляет насовсем задачи корзины, удалённые раньше cutoff (секунды от эпохи),
+        и самые старые сверх trash_max_items. Возвращает число удалённых."""
+        with self.storage.write(email):
+            user_trash = self.trash.get(email, {})
+            trash_order = self._trash_order(email)
+            entries = trash_order.after()
+            expired = self._expired_trash((user_trash[task_id] for _, task_id in entries), len(user_trash), cutoff)
+            if not expired:
+                return 0
+            for task in expired:
+                del user_trash[task.id]
+                trash_order.remove(deleted_key(task))
+            self._bump_version(email)
+            self.storage.purge_tasks(email, expired)
+        return len(expired)
+
+    def sweep_trash(self, batch_size: int = TRASH_SWEEP_BATCH) -> int:
+        """Соблюдает срок хранения корзины у всех пользователей; возвращает число удалённых задач.
+
+        Корзина проверяется через export_tasks, не оставаясь в памяти;
+        пользователи, у которых есть что удалить, очищаются пачками
+        по batch_size, и каждая пачка сохраняется один раз.
+        """
+        if not self.trash_max_age_days and not self.trash_max_items:
+            return 0
+        cutoff = now_seconds() - self.trash_max_age_days * 86400 if self.trash_max_age_days else None
+        with self.storage.read(None):
+            emails = [user.email for user in self.users]
+        purged = 0
+        for start in range(0, len(emails), batch_size):
+            due = []
+            for email in emails[start:start + batch_size]:
+                # Хранилище отдаёт корзину в порядке записи, а _expired_trash ждёт порядка удаления
+                trash = sorted(self.export_tasks(email)[1], key=deleted_key)
+                if self._expired_trash(trash, len(trash), cutoff):
+                    due.append(email)
+            if due:
+                with self.batch():
+                    for email in due:
+                        purged += self.purge_trash(email, cutoff)
+        return purged
+
+    def start_trash_sweeper(self, interval: float = TRASH_SWEEP_INTERVAL):
+        """Запускает фоновый поток, который раз в interval секунд вызывает sweep_trash"""
+        if self.trash_sweeper is None:
+            self.trash_sweeper = threading.Thread(target=self._sweep_trash_forever, args=(interval,), daemon=True)
+            self.trash_sweeper.start()
+
+    def _sweep_trash_forever(self, interval: float):
+        while True:
+            try:
+                self.sweep_trash()
+            except Exception:
+                # Очистка повторится через interval: поток не должен остановиться из-за одной ошибки
+                logger.exception("Не удалось очистить корзины")
+            time.sleep(interval)
 
 user_manager = UserManager()
+if TRASH_MAX_AGE_DAYS or TRASH_MAX_ITEMS:
+    user_manager.start_trash_sweeper()
+fragment_cache = LRUCache(FRAGMENT_CACHE_SIZE)
+
+app.config['PAGE_SIZE'] = PAGE_SIZE
+app.config['MAX_PAGE_SIZE'] = MAX_PAGE_SIZE
+app.extensions['user_manager'] = user_manager
+app.register_blueprint(api)
+# В cookie только идентификатор сессии, а в сессии — только email пользователя
+app.session_interface = ServerSessionInterface(create_session_store(),
+                                               app.permanent_session_lifetime.total_seconds(),
+                                               SESSION_SWEEP_INTERVAL)
+# Метрики (METRICS=1): /metrics для Prometheus, в режиме отладки — заголовок Server-Timing
+if metrics.ENABLED:
+    metrics.init_app(app)
+    metrics.instrument_storage(user_manager.storage)
+
+def current_user() -> Union[User, None]:
+    email = session.get('email')
+    return user_manager.get_user(email) if email else None
 
 @app.route('/')
 def index():
-    if 'user' in session:
+    if 'email' in session:
         return redirect(url_for('tasks'))
     return redirect(url_for('login'))
 
@@ -207,24 +581,57 @@ def login():
 
         user = user_manager.login_user(email_or_phone, password)
         if user:
-            session['user'] = user
+            # Новый идентификатор при входе: прежний мог знать кто-то ещё
+            session.regenerate()
+            session['email'] = user.email
             session.setdefault('theme', 'light')
-            flash(f'✅ Вход выполнен! Добро пожаловать, {user["name"]}!', 'success')
+            flash(f'✅ Вход выполнен! Добро пожаловать, {user.name}!', 'success')
             return redirect(url_for('tasks'))
         else:
             flash('❌ Ошибка: Неверный email/телефон или пароль.', 'error')
     
     return render_template('login.html')
 
+def page_size() -> int:
+    limit = request.args.get('limit', PAGE_SIZE, type=int)
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def cached_page(template: str, email: str, key: tuple, render_content):
+    """Страница из template с содержимым render_content(), с учётом версии задач пользователя.
+
+    key — всё, кроме пользователя, версии и даты, от чего зависит содержимое.
+    Если версия не менялась, браузер получает 304 по ETag, а сервер берёт
+    отрисованное содержимое из кэша. Пока есть непоказанные сообщения flash,
+    страница отдаётся целиком.
+    """
+    key = (template, email, user_manager.get_version(email), date.today().toordinal()) + key
+    etag = hashlib.sha1(repr(key + (session.get('theme', 'light'),)).encode("utf-8")).hexdigest()
+    has_flashes = '_flashes' in session
+    if not has_flashes and request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        content = fragment_cache.get(key)
+        if content is None:
+            content = render_content()
+            fragment_cache.put(key, content)
+        response = make_response(render_template(template, content=content))
+    if not has_flashes:
+        response.set_etag(etag)
+    # Браузер хранит страницу, но каждый раз сверяет её по ETag
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
 @app.route('/tasks', methods=['GET', 'POST'])
 def tasks():
-    if 'user' not in session:
+    user = current_user()
+    if user is None:
         flash('Пожалуйста, войдите в систему для просмотра задач.', 'warning')
         return redirect(url_for('login'))
     
-    user = session['user']
-    email = user['email']
+    email = user.email
     filter_type = request.args.get('filter', 'all')
+    query = request.args.get('q', '').strip()
     
     if request.method == 'POST':
         if 'task_text' in request.form:
@@ -236,47 +643,71 @@ def tasks():
                 else:
                     flash('❌ Ошибка при добавлении задачи', 'error')
         elif 'toggle_task' in request.form:
-            task_text = request.form['toggle_task']
-            if user_manager.toggle_task_status(email, task_text):
+            task_id = request.form['toggle_task']
+            if user_manager.toggle_task_status(email, task_id):
                 flash('✅ Статус задачи изменен!', 'success')
             else:
                 flash('❌ Ошибка при изменении статуса задачи', 'error')
         elif 'delete_task' in request.form:
-            task_text = request.form['delete_task']
-            if user_manager.delete_task(email, task_text):
+            task_id = request.form['delete_task']
+            if user_manager.delete_task(email, task_id):
                 flash('✅ Задача перемещена в корзину!', 'success')
             else:
                 flash('❌ Ошибка при удалении задачи', 'error')
         
-        return redirect(url_for('tasks', filter=filter_type))
+        return redirect(url_for('tasks', filter=filter_type, q=query or None))
     
-    tasks = user_manager.get_tasks(email, filter_type)
-    trash_count = len(user_manager.trash.get(email, []))
-    return render_template('tasks.html', 
-                         user=user, 
-                         tasks=tasks, 
-                         filter_type=filter_type,
-                         trash_count=trash_count,
-                         now=datetime.now(),
-                         datetime=datetime)  
+    limit = page_size()
+    cursor = request.args.get('cursor')
+
+    def render_content():
+        tasks = user_manager.get_tasks(email, filter_type, limit + 1, cursor, query)
+        next_cursor = None
+        if len(tasks) > limit:
+            tasks = tasks[:limit]
+            next_cursor = user_manager.task_cursor(email, filter_type, tasks[-1])
+        return render_template('tasks_content.html', 
+                             user=user, 
+                             tasks=tasks, 
+                             filter_type=filter_type,
+                             query=query,
+                             limit=limit,
+                             next_cursor=next_cursor,
+                             counts=user_manager.get_counts(email),
+                             days_left_by_id=user_manager.get_days_left(email, tasks),
+                             urgent_days=URGENT_DAYS,
+                             now=datetime.now())
+
+    return cached_page('tasks.html', email, (filter_type, query, cursor, limit), render_content)
 
 @app.route('/trash')
 def trash():
-    if 'user' not in session:
+    user = current_user()
+    if user is None:
         return redirect(url_for('login'))
-    
-    user = session['user']
-    trash_tasks = user_manager.trash.get(user['email'], [])
-    return render_template('trash.html', user=user, tasks=trash_tasks)
+
+    limit = page_size()
+    cursor = request.args.get('cursor')
+
+    def render_content():
+        trash_tasks = user_manager.get_trash(user.email, limit + 1, cursor)
+        next_cursor = None
+        if len(trash_tasks) > limit:
+            trash_tasks = trash_tasks[:limit]
+            next_cursor = user_manager.trash_cursor(user.email, trash_tasks[-1])
+        return render_template('trash_content.html', user=user, tasks=trash_tasks, limit=limit,
+                               next_cursor=next_cursor)
+
+    return cached_page('trash.html', user.email, (cursor, limit), render_content)
 
 @app.route('/restore_task', methods=['POST'])
 def restore_task():
-    if 'user' not in session:
+    user = current_user()
+    if user is None:
         return redirect(url_for('login'))
-    
-    user = session['user']
-    task_text = request.form['task_text']
-    if user_manager.restore_task(user['email'], task_text):
+
+    task_id = request.form['task_id']
+    if user_manager.restore_task(user.email, task_id):
         flash('✅ Задача восстановлена!', 'success')
     else:
         flash('❌ Ошибка восстановления', 'error')
@@ -284,11 +715,11 @@ def restore_task():
 
 @app.route('/empty_trash', methods=['POST'])
 def empty_trash():
-    if 'user' not in session:
+    user = current_user()
+    if user is None:
         return redirect(url_for('login'))
-    
-    user = session['user']
-    if user_manager.empty_trash(user['email']):
+
+    if user_manager.empty_trash(user.email):
         flash('🗑️ Корзина очищена!', 'success')
     else:
         flash('ℹ️ Корзина уже пуста', 'info')
@@ -302,7 +733,8 @@ def toggle_theme():
 
 @app.route('/logout')
 def logout():
-    session.pop('user', None)
+    session.pop('email', None)
+    session.regenerate()
     flash('Вы успешно вышли из системы.', 'info')
     return redirect(url_for('login'))
 
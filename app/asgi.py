@@ -0,0 +1,338 @@
+"""Асинхронный режим: то же приложение как ASGI-приложение.
+
+JSON API (/api/v1) обслуживается прямо в цикле событий: те же функции
+операций, что и у blueprint в api.py, выполняются в ограниченном пуле потоков,
+поэтому запись файлов или базы не блокирует цикл, а ожидающие соединения
+не занимают потоков. Остальные страницы отдаёт Flask-приложение из app.py,
+оно вызывается в том же пуле. Сессии общие со страницами: то же хранилище
+сессий (sessions.py).
+
+Запуск (нужен ASGI-сервер, например uvicorn):
+    uvicorn asgi:application --app-dir app
+"""
+import asyncio
+import io
+import json
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from werkzeug.http import dump_cookie, parse_cookie
+
+from api import (batch_result, check_login, create_task_result, delete_task_result, empty_trash_result,
+                 restore_task_result, tasks_page, toggle_task_result, trash_page)
+from app import app, user_manager, UserManager, PAGE_SIZE, MAX_PAGE_SIZE
+from records import Task, User
+from sessions import ServerSession
+
+# Сколько потоков выполняют операции UserManager и страницы Flask
+ASYNC_WORKERS = int(os.environ.get("ASYNC_WORKERS", "8"))
+# Сколько операций может ждать свободного потока; остальные ждут в цикле событий
+MAX_PENDING_CALLS = 4 * ASYNC_WORKERS
+
+
+class AsyncUserManager:
+    """UserManager с awaitable-методами: каждый вызов выполняется в пуле потоков.
+
+    Пул ограничен max_workers потоками, а очередь к нему — max_pending
+    вызовами, так что всплеск запросов ждёт в цикле событий, а не
+    копится в очереди пула.
+    """
+
+    def __init__(self, manager: UserManager, max_workers: int = ASYNC_WORKERS,
+                 max_pending: int = MAX_PENDING_CALLS):
+        self.manager = manager
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="user-manager")
+        self.pending = asyncio.Semaphore(max_pending)
+
+    async def call(self, func, *args):
+        """func(*args) в пуле потоков; для нескольких операций подряд — за один переход в пул"""
+        async with self.pending:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, partial(func, *args))
+
+    async def register_user(self, user_data: Dict[str, str]) -> bool:
+        return await self.call(self.manager.register_user, user_data)
+
+    async def login_user(self, email_or_phone: str, password: str) -> Optional[User]:
+        return await self.call(self.manager.login_user, email_or_phone, password)
+
+    async def add_task(self, email: str, task_text: str, due_date: str = None) -> Optional[Task]:
+        return await self.call(self.manager.add_task, email, task_text, due_date)
+
+    async def get_tasks(self, email: str, filter_type: str = "all", limit: int = None, cursor: str = None,
+                        query: str = None) -> List[Task]:
+        return await self.call(self.manager.get_tasks, email, filter_type, limit, cursor, query)
+
+    async def get_user(self, email: str) -> Optional[User]:
+        return await self.call(self.manager.get_user, email)
+
+    async def get_task(self, email: str, task_id: str) -> Optional[Task]:
+        return await self.call(self.manager.get_task, email, task_id)
+
+    async def get_counts(self, email: str) -> Dict[str, int]:
+        return await self.call(self.manager.get_counts, email)
+
+    async def get_trash(self, email: str, limit: int = None, cursor: str = None) -> List[Task]:
+        return await self.call(self.manager.get_trash, email, limit, cursor)
+
+    async def toggle_task_status(self, email: str, task_id: str) -> bool:
+        return await self.call(self.manager.toggle_task_status, email, task_id)
+
+    async def delete_task(self, email: str, task_id: str) -> bool:
+        return await self.call(self.manager.delete_task, email, task_id)
+
+    async def restore_task(self, email: str, task_id: str) -> bool:
+        return await self.call(self.manager.restore_task, email, task_id)
+
+    async def empty_trash(self, email: str) -> bool:
+        return await self.call(self.manager.empty_trash, email)
+
+    async def close(self):
+        """Сохраняет отложенные изменения хранилища и останавливает пул"""
+        close = getattr(self.manager.storage, "close", None)
+        if close is not None:
+            await self.call(close)
+        self.executor.shutdown(wait=True)
+
+
+class Response:
+    def __init__(self, data, status: int = 200, headers: List[Tuple[str, str]] = None):
+        self.body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.status = status
+        self.headers = [("Content-Type", "application/json")] + (headers or [])
+
+
+def error(message: str, status: int) -> Response:
+    return Response({"error": message}, status)
+
+
+class Request:
+    def __init__(self, scope, body: bytes, session: ServerSession):
+        self.method = scope["method"]
+        self.args = {name: values[0] for name, values in parse_qs(scope["query_string"].decode("latin-1")).items()}
+        self.body = body
+        self.session = session
+
+    def json(self) -> dict:
+        try:
+            data = json.loads(self.body)
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def page_args(self) -> Tuple[int, Optional[str]]:
+        try:
+            limit = int(self.args.get("limit", PAGE_SIZE))
+        except ValueError:
+            limit = PAGE_SIZE
+        return max(1, min(limit, MAX_PAGE_SIZE)), self.args.get("cursor")
+
+
+class AsgiApp:
+    """ASGI-приложение: /api/v1 — асинхронно, остальное — Flask-приложение в пуле потоков"""
+
+    def __init__(self, flask_app, manager: AsyncUserManager):
+        self.flask_app = flask_app
+        self.manager = manager
+        self.sessions = flask_app.session_interface
+        self.cookie_name = flask_app.config["SESSION_COOKIE_NAME"]
+        self.routes = [
+            ("POST", re.compile(r"/api/v1/login"), self.login),
+            ("GET", re.compile(r"/api/v1/tasks"), self.list_tasks),
+            ("POST", re.compile(r"/api/v1/tasks"), self.create_task),
+            ("POST", re.compile(r"/api/v1/tasks/([^/]+)/toggle"), self.toggle_task),
+            ("DELETE", re.compile(r"/api/v1/tasks/([^/]+)"), self.delete_task),
+            ("GET", re.compile(r"/api/v1/trash"), self.list_trash),
+            ("POST", re.compile(r"/api/v1/trash/([^/]+)/restore"), self.restore_task),
+            ("DELETE", re.compile(r"/api/v1/trash"), self.empty_trash),
+            ("POST", re.compile(r"/api/v1/batch"), self.batch),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] != "http":
+            return
+        body = await read_body(receive)
+        route = self.find_route(scope["method"], scope["path"])
+        if route is None:
+            status, headers, content = await self.manager.call(call_wsgi, self.flask_app, wsgi_environ(scope, body))
+        else:
+            handler, params = route
+            session = await self.load_session(scope)
+            response = await handler(Request(scope, body, session), *params)
+            if session.touched and session.sid is not None:
+                # Прошла половина срока сессии: продлеваем
+                response.headers += await self.save_session(session)
+            status, headers, content = response.status, response.headers, response.body
+        headers = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+        if not any(name == b"content-length" for name, _ in headers):
+            headers.append((b"content-length", str(len(content)).encode("latin-1")))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": content})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.manager.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def find_route(self, method: str, path: str):
+        path_matched = False
+        for route_method, pattern, handler in self.routes:
+            match = pattern.fullmatch(path)
+            if match is None:
+                continue
+            if route_method == method:
+                return handler, match.groups()
+            path_matched = True
+        if path_matched:
+            return self.method_not_allowed, ()
+        return None
+
+    async def load_session(self, scope) -> ServerSession:
+        cookies = parse_cookie("; ".join(value.decode("latin-1") for name, value in scope["headers"]
+                                         if name == b"cookie"))
+        sid = cookies.get(self.cookie_name)
+        if self.sessions.store.blocking:
+            session = await self.manager.call(self.sessions.load, sid)
+        else:
+            session = self.sessions.load(sid)
+        return session or ServerSession()
+
+    async def save_session(self, session: ServerSession) -> List[Tuple[str, str]]:
+        """Заголовки ответа: Set-Cookie, если у сессии новый идентификатор"""
+        if self.sessions.store.blocking:
+            is_new = await self.manager.call(self.sessions.save, session)
+        else:
+            is_new = self.sessions.save(session)
+        if not is_new:
+            return []
+        config = self.flask_app.config
+        return [("Set-Cookie", dump_cookie(self.cookie_name, session.sid, path="/",
+                                           httponly=config["SESSION_COOKIE_HTTPONLY"],
+                                           secure=config["SESSION_COOKIE_SECURE"],
+                                           samesite=config["SESSION_COOKIE_SAMESITE"]))]
+
+    async def method_not_allowed(self, request: Request) -> Response:
+        return error("method not allowed", 405)
+
+    async def login(self, request: Request) -> Response:
+        user = await self.manager.call(check_login, self.manager.manager, request.json())
+        if not user:
+            return error("invalid credentials", 401)
+        request.session.regenerate()
+        request.session['email'] = user.email
+        return Response({"name": user.name, "email": user.email},
+                        headers=await self.save_session(request.session))
+
+    async def current_email(self, request: Request) -> Optional[str]:
+        email = request.session.get('email')
+        user = await self.manager.get_user(email) if email else None
+        return user.email if user else None
+
+    async def call_api(self, request: Request, func, *args) -> Response:
+        """func(user_manager, email, *args) из api.py в пуле потоков, если пользователь вошёл"""
+        email = await self.current_email(request)
+        if email is None:
+            return error("not authenticated", 401)
+        result = await self.manager.call(func, self.manager.manager, email, *args)
+        return Response(*result) if isinstance(result, tuple) else Response(result)
+
+    async def list_tasks(self, request: Request) -> Response:
+        limit, cursor = request.page_args()
+        return await self.call_api(request, tasks_page, request.args.get('filter', 'all'), limit, cursor,
+                                   request.args.get('q', '').strip())
+
+    async def create_task(self, request: Request) -> Response:
+        return await self.call_api(request, create_task_result, request.json())
+
+    async def toggle_task(self, request: Request, task_id: str) -> Response:
+        return await self.call_api(request, toggle_task_result, task_id)
+
+    async def delete_task(self, request: Request, task_id: str) -> Response:
+        return await self.call_api(request, delete_task_result, task_id)
+
+    async def list_trash(self, request: Request) -> Response:
+        return await self.call_api(request, trash_page, *request.page_args())
+
+    async def restore_task(self, request: Request, task_id: str) -> Response:
+        return await self.call_api(request, restore_task_result, task_id)
+
+    async def empty_trash(self, request: Request) -> Response:
+        return await self.call_api(request, empty_trash_result)
+
+    async def batch(self, request: Request) -> Response:
+        return await self.call_api(request, batch_result, request.json())
+
+async def read_body(receive) -> bytes:
+    chunks = []
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        more_body = message.get("more_body", False)
+    return b"".join(chunks)
+
+
+def wsgi_environ(scope, body: bytes) -> dict:
+    """Окружение WSGI (PEP 3333) для запроса ASGI"""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1")
+        value = value.decode("latin-1")
+        if name == "content-type":
+            environ["CONTENT_TYPE"] = value
+        elif name != "content-length":
+            key = "HTTP_" + name.upper().replace("-", "_")
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def call_wsgi(wsgi_app, environ: dict) -> Tuple[int, List[Tuple[str, str]], bytes]:
+    """Выполняет WSGI-приложение целиком: (статус, заголовки, тело)"""
+    started = {}
+
+    def start_response(status: str, headers, exc_info=None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = headers
+
+    result = wsgi_app(environ, start_response)
+    try:
+        body = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return started["status"], started["headers"], body
+
+
+application = AsgiApp(app, AsyncUserManager(user_manager))
@@ -0,0 +1,243 @@
+"""Массовый импорт и выгрузка пользователей и задач в JSON Lines или CSV.
+
+Одна строка — одна запись: пользователь (type=user: name, email, phone,
+password), задача (type=task) или задача в корзине (type=trash) с полями
+email, id, text, completed, created_at, due_date (и deleted_at в корзине).
+Время и срок в другом формате сохраняются как есть, как и в файлах задач.
+Пользователи идут раньше своих задач — так их и выгружает export.
+В CSV одна строка заголовка с полями COLUMNS; поля задачи, которых нет
+в COLUMNS, сохраняются только в JSON Lines.
+
+Файл читается потоком: в памяти не больше двух пачек по batch_size
+записей. Записи проверяются по тем же правилам, что и при регистрации
+(records.is_*_valid), с workers > 1 — в пуле процессов, пока предыдущая
+пачка сохраняется. Каждая пачка добавляется внутри UserManager.batch()
+и сохраняется хранилищем один раз. Пользователи с занятым email или
+телефоном и задачи с уже существующим id пропускаются, поэтому
+повторный импорт выгрузки ничего не меняет (задачам без id
+присваиваются новые).
+
+Выгрузка пишет сначала всех пользователей, потом задачи и корзину
+каждого; задачи, которые ещё не читались, в памяти не остаются.
+
+Запуск: python bulk.py import|export <файл> [--format jsonl|csv] [--batch-size N] [--workers N]
+(файл "-" — стандартный ввод или вывод)
+"""
+import argparse
+import csv
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from records import Task, User, is_email_valid, is_name_valid, is_password_valid, is_phone_valid
+
+COLUMNS = ("type", "email", "name", "phone", "password", "id", "text", "completed", "created_at", "due_date",
+           "deleted_at")
+USER_FIELDS = ("name", "email", "phone", "password")
+TASK_TYPES = ("task", "trash")
+BATCH_SIZE = 50000
+MAX_ERRORS_SHOWN = 20
+
+# Запись после проверки: (номер строки, пользователь или (тип, email, задача) или None, ошибка или None)
+Checked = Tuple[int, object, Optional[str]]
+
+
+def read_records(f, fmt: str) -> Iterator[Tuple[int, object]]:
+    """(номер строки, запись): для jsonl — неразобранная строка, её разбирает check_record"""
+    if fmt == "csv":
+        for line_no, row in enumerate(csv.DictReader(f), 2):
+            yield line_no, row
+        return
+    for line_no, line in enumerate(f, 1):
+        if line.strip():
+            yield line_no, line
+
+
+def parse_completed(value) -> Optional[bool]:
+    if isinstance(value, bool):
+        return value
+    return {"": False, "0": False, "false": False, "1": True, "true": True}.get(str(value).lower())
+
+
+def check_record(line_no: int, record) -> Checked:
+    if isinstance(record, str):
+        try:
+            record = json.loads(record)
+        except ValueError:
+            return line_no, None, "не JSON"
+        if not isinstance(record, dict):
+            return line_no, None, "запись должна быть объектом"
+    kind = record.get("type")
+    if kind == "user":
+        if not all(isinstance(record.get(field), str) for field in USER_FIELDS):
+            return line_no, None, "у пользователя нужны name, email, phone и password"
+        if not is_name_valid(record["name"]):
+            return line_no, None, "недопустимое имя"
+        if not is_email_valid(record["email"]):
+            return line_no, None, "недопустимый email"
+        if not is_phone_valid(record["phone"]):
+            return line_no, None, "недопустимый телефон"
+        if not is_password_valid(record["password"]):
+            return line_no, None, "недопустимый пароль"
+        return line_no, User.from_dict(record), None
+    if kind not in TASK_TYPES:
+        return line_no, None, f"неизвестный type: {kind!r}"
+    email = record.get("email")
+    if not isinstance(email, str) or not is_email_valid(email):
+        return line_no, None, "недопустимый email"
+    text = record.get("text")
+    if not isinstance(text, str) or not text:
+        return line_no, None, "пустой текст задачи"
+    completed = parse_completed(record.get("completed", False))
+    if completed is None:
+        return line_no, None, "completed должно быть true или false"
+    # В CSV пустая ячейка — значит, значения нет, а поля пользователя у задачи пусты
+    data = {key: value for key, value in record.items()
+            if key is not None and key != "type" and key not in USER_FIELDS and value is not None and value != ""}
+    data["completed"] = completed
+    # created_at, due_date и deleted_at в другом формате не отклоняются: Task.from_dict
+    # оставляет их в extra, как при чтении файлов задач, и выгрузка вернёт их как было
+    if "id" in data and not isinstance(data["id"], str):
+        return line_no, None, "id должен быть строкой"
+    return line_no, (kind, email, Task.from_dict(data)), None
+
+
+def check_chunk(chunk: List[Tuple[int, object]]) -> List[Checked]:
+    return [check_record(line_no, record) for line_no, record in chunk]
+
+
+def checked_batches(records: Iterable[Tuple[int, object]], batch_size: int,
+                    workers: int) -> Iterator[List[Checked]]:
+    """Проверенные пачки по batch_size записей в порядке файла"""
+    records = iter(records)
+    batches = iter(lambda: list(islice(records, batch_size)), [])
+    if workers <= 1:
+        for batch in batches:
+            yield check_chunk(batch)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        pending = None
+        for batch in batches:
+            # Несколько частей на процесс, чтобы медленная часть не задерживала всю пачку
+            step = -(-len(batch) // (workers * 4))
+            futures = [pool.submit(check_chunk, batch[i:i + step]) for i in range(0, len(batch), step)]
+            if pending is not None:
+                yield [item for future in pending for item in future.result()]
+            pending = futures
+        if pending is not None:
+            yield [item for future in pending for item in future.result()]
+
+
+class ImportResult:
+    def __init__(self):
+        self.added = 0
+        self.skipped = 0
+        self.errors: List[Tuple[int, str]] = []  # первые MAX_ERRORS_SHOWN
+        self.error_count = 0
+
+    def error(self, line_no: int, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS_SHOWN:
+            self.errors.append((line_no, message))
+
+
+def commit_batch(user_manager, batch: List[Checked], result: ImportResult):
+    """Добавляет пачку, сохраняя её один раз"""
+    users: List[User] = []
+    groups: Dict[Tuple[str, str], List[Tuple[int, Task]]] = {}
+    for line_no, item, error in batch:
+        if error is not None:
+            result.error(line_no, error)
+        elif isinstance(item, User):
+            users.append(item)
+        else:
+            kind, email, task = item
+            groups.setdefault((email, kind), []).append((line_no, task))
+    with user_manager.batch():
+        added = user_manager.import_users(users)
+        result.added += added
+        result.skipped += len(users) - added
+        for (email, kind), tasks in groups.items():
+            if user_manager.get_user(email) is None:
+                for line_no, _ in tasks:
+                    result.error(line_no, f"нет пользователя {email}")
+                continue
+            added = user_manager.import_tasks(email, [task for _, task in tasks], trash=kind == "trash")
+            result.added += added
+            result.skipped += len(tasks) - added
+
+
+def import_records(user_manager, f, fmt: str = "jsonl", batch_size: int = BATCH_SIZE,
+                   workers: int = 1) -> ImportResult:
+    result = ImportResult()
+    for batch in checked_batches(read_records(f, fmt), batch_size, workers):
+        commit_batch(user_manager, batch, result)
+    return result
+
+
+def export_rows(user_manager) -> Iterator[Dict]:
+    with user_manager.storage.read(None):
+        users = list(user_manager.users)
+    for user in users:
+        yield {"type": "user", **user.to_dict()}
+    for user in users:
+        tasks, trash = user_manager.export_tasks(user.email)
+        for kind, user_tasks in (("task", tasks), ("trash", trash)):
+            for task in user_tasks:
+                yield {"type": kind, "email": user.email, **task.to_dict()}
+
+
+def export_records(user_manager, f, fmt: str = "jsonl") -> int:
+    """Возвращает число выгруженных записей"""
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(f, COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        for row in export_rows(user_manager):
+            if "completed" in row:
+                row["completed"] = int(row["completed"])
+            writer.writerow(row)
+            count += 1
+        return count
+    for row in export_rows(user_manager):
+        f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+def open_file(filename: str, mode: str):
+    if filename == "-":
+        return sys.stdin if mode == "r" else sys.stdout
+    return open(filename, mode, encoding="utf-8", newline="")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=("import", "export"))
+    parser.add_argument("file")
+    parser.add_argument("--format", choices=("jsonl", "csv"),
+                        help="по умолчанию — по расширению файла, иначе jsonl")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="записей в одном сохранении")
+    parser.add_argument("--workers", type=int, default=1, help="процессов для проверки записей")
+    args = parser.parse_args()
+    fmt = args.format or ("csv" if args.file.endswith(".csv") else "jsonl")
+
+    # Хранилище — то же, что у приложения (STORAGE_BACKEND и остальные переменные окружения)
+    from app import user_manager
+
+    if args.command == "import":
+        with open_file(args.file, "r") as f:
+            result = import_records(user_manager, f, fmt, args.batch_size, args.workers)
+        print(f"✅ Добавлено записей: {result.added}, пропущено как уже существующих: {result.skipped}",
+              file=sys.stderr)
+        if result.error_count:
+            print(f"⚠️ Отклонено записей: {result.error_count}", file=sys.stderr)
+            for line_no, message in sorted(result.errors):
+                print(f"  строка {line_no}: {message}", file=sys.stderr)
+            sys.exit(1)
+    else:
+        with open_file(args.file, "w") as f:
+            count = export_records(user_manager, f, fmt)
+        print(f"✅ Выгружено записей: {count}", file=sys.stderr)
@@ -0,0 +1,36 @@
+import threading
+from collections import OrderedDict
+from typing import Hashable
+
+
+class LRUCache:
+    """Кэш на max_entries записей: при переполнении вытесняются давно не читавшиеся.
+
+    Общий для всех потоков процесса.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Hashable, object]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable, default=None):
+        with self.lock:
+            value = self.entries.get(key, default)
+            if key in self.entries:
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,240 @@
+import re
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from records import Task
+
+WORD_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Слова текста без учёта регистра; ё считается за е"""
+    return WORD_RE.findall(text.casefold().replace("ё", "е"))
+
+
+class DueIndex:
+    """Невыполненные задачи со сроком, отсортированные по сроку.
+
+    Срочные и просроченные задачи — это префикс списка до нужного дня,
+    поэтому их выборка — бинарный поиск, а не проход по всем задачам.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[int, str]] = ()):
+        self.entries: List[Tuple[int, str]] = sorted(entries)  # (due_day, task_id)
+
+    def add(self, due_day: int, task_id: str):
+        insort(self.entries, (due_day, task_id))
+
+    def remove(self, due_day: int, task_id: str):
+        i = bisect_left(self.entries, (due_day, task_id))
+        if i < len(self.entries) and self.entries[i] == (due_day, task_id):
+            del self.entries[i]
+
+    def count_until(self, last_day: int) -> int:
+        return bisect_left(self.entries, (last_day + 1,))
+
+    def iter_until(self, last_day: int, after: Optional[Tuple[int, str]] = None) -> Iterator[Tuple[int, str]]:
+        """(срок, id) задач со сроком не позже last_day по возрастанию срока, начиная сразу после after"""
+        start = 0 if after is None else bisect_right(self.entries, after)
+        end = bisect_left(self.entries, (last_day + 1,))
+        for i in range(start, end):
+            if i >= len(self.entries):
+                break
+            yield self.entries[i]
+
+
+def created_key(task: Task) -> Tuple[int, str]:
+    """Место задачи в списке: время создания, при равном — id (новые id возрастают, storage.new_task_id)"""
+    return (task.created or 0, task.id)
+
+
+def deleted_key(task: Task) -> Tuple[int, str]:
+    """Место задачи в корзине: время удаления, при равном — id; удалённые до появления отметки — первыми"""
+    return (task.deleted or 0, task.id)
+
+
+class OrderIndex:
+    """Порядок задач для постраничного вывода.
+
+    Задачи упорядочены по ключу из сохраняемых полей задачи (created_key
+    или deleted_key). Курсор — ключ последней показанной задачи, поэтому
+    любой процесс, в том числе после перестройки индекса, продолжает
+    список с того же места, а добавление и удаление задач его не сдвигает.
+    """
+
+    def __init__(self, keys: Iterable[Tuple[int, str]] = ()):
+        self.keys: List[Tuple[int, str]] = sorted(keys)
+
+    def add(self, key: Tuple[int, str]):
+        if not self.keys or key > self.keys[-1]:
+            # Обычный случай: новая задача — самая поздняя
+            self.keys.append(key)
+        else:
+            insort(self.keys, key)
+
+    def remove(self, key: Tuple[int, str]):
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            del self.keys[i]
+
+    def clear(self):
+        self.keys = []
+
+    def after(self, cursor: Optional[Tuple[int, str]] = None) -> Iterator[Tuple[int, str]]:
+        """Ключи (время, id) задач после курсора, по порядку"""
+        keys = self.keys
+        start = 0 if cursor is None else bisect_right(keys, cursor)
+        for i in range(start, len(keys)):
+            yield keys[i]
+
+
+class SearchIndex:
+    """Обратный индекс слов в задачах одного пользователя.
+
+    Для каждого слова хранится множество id задач, в которых оно есть,
+    а сами слова — в отсортированном списке. Слово запроса считается
+    началом слова задачи: бинарный поиск находит диапазон слов с этим
+    началом, поэтому время поиска зависит от числа совпадений, а не от
+    числа задач. Найденные задачи идут в порядке created_key.
+    """
+
+    def __init__(self, tasks: Iterable[Task] = ()):
+        self.postings: Dict[str, Set[str]] = {}
+        self.words: List[str] = []
+        self.key_of: Dict[str, Tuple[int, str]] = {}
+        for task in tasks:
+            self._add(task)
+        self.words = sorted(self.postings)
+
+    def add(self, task: Task):
+        for word in self._add(task):
+            insort(self.words, word)
+
+    def _add(self, task: Task) -> List[str]:
+        """Добавляет задачу в postings; возвращает слова, которых там ещё не было"""
+        self.key_of[task.id] = created_key(task)
+        new_words = []
+        for word in set(tokenize(task.text)):
+            task_ids = self.postings.get(word)
+            if task_ids is None:
+                task_ids = self.postings[word] = set()
+                new_words.append(word)
+            task_ids.add(task.id)
+        return new_words
+
+    def remove(self, task: Task):
+        if self.key_of.pop(task.id, None) is None:
+            return
+        for word in set(tokenize(task.text)):
+            task_ids = self.postings.get(word)
+            if task_ids is None:
+                continue
+            task_ids.discard(task.id)
+            if not task_ids:
+                del self.postings[word]
+                del self.words[bisect_left(self.words, word)]
+
+    def _starting_with(self, prefix: str) -> Set[str]:
+        start = bisect_left(self.words, prefix)
+        end = bisect_left(self.words, prefix[:-1] + chr(ord(prefix[-1]) + 1))
+        found = set()
+        for word in self.words[start:end]:
+            found |= self.postings[word]
+        return found
+
+    def search(self, query: str, after: Optional[Tuple[int, str]] = None) -> List[str]:
+        """id задач, в которых каждое слово запроса начинает какое-то слово задачи.
+
+        after — ключ (created_key) последней показанной задачи: выдача продолжится после неё.
+        """
+        found = None
+        # Длинные слова запроса отсекают больше задач — с них и начинаем
+        for prefix in sorted(set(tokenize(query)), key=len, reverse=True):
+            matched = self._starting_with(prefix)
+            found = matched if found is None else found & matched
+            if not found:
+                return []
+        if found is None:
+            return []
+        key_of = self.key_of
+        if after is not None:
+            found = [task_id for task_id in found if key_of[task_id] > after]
+        return sorted(found, key=key_of.__getitem__)
+
+
+class TaskIndex:
+    """Вспомогательные структуры над задачами одного пользователя.
+
+    Счётчики задач обновляются при каждом изменении, поэтому
+    для показа количества задач список не просматривается.
+    Индекс для поиска строится при первом поиске.
+    """
+
+    def __init__(self, tasks: Dict[str, Task]):
+        self.due_days: Dict[str, int] = {}
+        self.words: Optional[SearchIndex] = None
+        self.total = 0
+        self.completed = 0
+        for task in tasks.values():
+            self._add(task)
+        # Порядок и сроки сортируются один раз, а не вставкой по задаче: O(n log n) вместо O(n²)
+        self.order = OrderIndex(map(created_key, tasks.values()))
+        self.due = DueIndex((due_day, task_id) for task_id, due_day in self.due_days.items()
+                            if not tasks[task_id].completed)
+
+    def add(self, task: Task):
+        self._add(task)
+        self.order.add(created_key(task))
+        if task.due_day is not None and not task.completed:
+            self.due.add(task.due_day, task.id)
+
+    def _add(self, task: Task):
+        """Всё, кроме порядка и индекса сроков"""
+        if self.words is not None:
+            self.words.add(task)
+        self.total += 1
+        if task.completed:
+            self.completed += 1
+        if task.due_day is not None:
+            self.due_days[task.id] = task.due_day
+
+    def remove(self, task: Task):
+        self.order.remove(created_key(task))
+        if self.words is not None:
+            self.words.remove(task)
+        self.total -= 1
+        if task.completed:
+            self.completed -= 1
+        due_day = self.due_days.pop(task.id, None)
+        if due_day is not None and not task.completed:
+            self.due.remove(due_day, task.id)
+
+    def set_completed(self, task: Task):
+        """Вызывается после смены статуса задачи"""
+        self.completed += 1 if task.completed else -1
+        due_day = self.due_days.get(task.id)
+        if due_day is None:
+            return
+        if task.completed:
+            self.due.remove(due_day, task.id)
+        else:
+            self.due.add(due_day, task.id)
+
+    def counts(self, today: int, urgent_days: int) -> Dict[str, int]:
+        return {
+            "all": self.total,
+            "active": self.total - self.completed,
+            "completed": self.completed,
+            "urgent": self.due.count_until(today + urgent_days),
+            "overdue": self.due.count_until(today - 1)
+        }
+
+    def search(self, tasks: Dict[str, Task], query: str, after: Optional[Tuple[int, str]] = None) -> List[str]:
+        """SearchIndex.search; tasks — задачи пользователя, из которых индекс строится в первый раз"""
+        if self.words is None:
+            self.words = SearchIndex(tasks.values())
+        return self.words.search(query, after)
+
+    def days_left(self, task_id: str, today: int) -> Optional[int]:
+        due_day = self.due_days.get(task_id)
+        return None if due_day is None else due_day - today
@@ -0,0 +1,210 @@
+"""Метрики запросов, хранилища и шаблонов в текстовом формате Prometheus.
+
+Сбор включается переменной окружения METRICS=1. Когда он выключен,
+обработчики запросов, сигналы шаблонов и обёртки методов хранилища
+не устанавливаются вовсе, а в get_tasks остаётся одна проверка ENABLED.
+
+Метрики считаются в памяти процесса: при нескольких процессах
+у каждого свой /metrics.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Dict, Tuple
+
+from flask import Flask, before_render_template, g, request, template_rendered
+
+ENABLED = os.environ.get("METRICS") == "1"
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+BYTES_BUCKETS = (1024, 16384, 131072, 1048576, 8388608, 67108864, 536870912)
+COUNT_BUCKETS = (1, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum")
+
+    def __init__(self, buckets: int):
+        self.counts = [0] * (buckets + 1)  # последняя — больше всех границ (+Inf)
+        self.sum = 0.0
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # name -> (описание, границы корзин, {метки: Histogram})
+        self.families: Dict[str, Tuple[str, tuple, Dict[tuple, Histogram]]] = {}
+
+    def histogram(self, name: str, help: str, buckets: tuple):
+        self.families[name] = (help, buckets, {})
+
+    def observe(self, name: str, value: float, **labels):
+        _, buckets, series = self.families[name]
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(len(buckets))
+            histogram.counts[bisect_left(buckets, value)] += 1
+            histogram.sum += value
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            for name, (help, buckets, series) in self.families.items():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    labels = ",".join(f'{label}="{escape(str(value))}"' for label, value in key)
+                    total = 0
+                    for bound, count in zip(buckets + ("+Inf",), histogram.counts):
+                        total += count
+                        le = f'le="{bound}"'
+                        lines.append(f"{name}_bucket{{{labels + ',' + le if labels else le}}} {total}")
+                    suffix = f"{{{labels}}}" if labels else ""
+                    lines.append(f"{name}_sum{suffix} {histogram.sum!r}")
+                    lines.append(f"{name}_count{suffix} {total}")
+        return "\n".join(lines) + "\n"
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = Registry()
+registry.histogram("http_request_duration_seconds", "Время обработки запроса", SECONDS_BUCKETS)
+registry.histogram("template_render_seconds", "Время отрисовки шаблона", SECONDS_BUCKETS)
+registry.histogram("storage_operation_seconds", "Время операции хранилища", SECONDS_BUCKETS)
+registry.histogram("storage_operation_bytes", "Байт прочитано или записано операцией хранилища", BYTES_BUCKETS)
+registry.histogram("get_tasks_scanned_tasks", "Задач просмотрено одним вызовом get_tasks", COUNT_BUCKETS)
+
+
+class RequestState(threading.local):
+    """Время текущего запроса по частям — для заголовка Server-Timing"""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = None  # None — вне запроса
+        self.depth = 0  # вложенность операций хранилища: учитывается только внешняя
+        self.renders = []  # начала отрисовки вложенных шаблонов
+
+
+local = RequestState()
+
+
+def add_timing(part: str, seconds: float):
+    if local.timings is not None:
+        local.timings[part] = local.timings.get(part, 0.0) + seconds
+
+
+class Tally:
+    """Итератор-обёртка, который считает выданные элементы"""
+
+    __slots__ = ("iterator", "count")
+
+    def __init__(self, iterable):
+        self.iterator = iter(iterable)
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = next(self.iterator)
+        self.count += 1
+        return item
+
+
+# Операции хранилища: имя метода -> (метка op, байт в операции по (storage, args, result))
+STORAGE_OPERATIONS = {
+    "refresh": ("refresh", None),
+    "flush": ("flush", None),
+    "add_user": ("add_user", None),
+    "ensure_user": ("ensure_user", None),
+    "add_task": ("add_task", None),
+    "update_task": ("update_task", None),
+    "delete_task": ("delete_task", None),
+    "restore_task": ("restore_task", None),
+    "empty_trash": ("empty_trash", None),
+    "purge_tasks": ("purge_tasks", None),
+    "_load_data": ("load_data", lambda storage, args, result: file_size(args[0])),
+    "_save_data": ("save_data", lambda storage, args, result: file_size(args[1])),
+    "_save_file": ("save_file", lambda storage, args, result: file_size(storage.files[args[0]])),
+    "_read_chunk": ("read_chunk", lambda storage, args, result: len(result)),
+    "_save_shard": ("save_shard", lambda storage, args, result: file_size(storage._shard_path(args[0]))),
+}
+
+
+def file_size(filename: str) -> int:
+    try:
+        return os.path.getsize(filename)
+    except OSError:
+        return 0
+
+
+def instrument_storage(storage):
+    """Заменяет методы экземпляра storage обёртками, которые замеряют время и объём"""
+    backend = type(storage).__name__
+    for method_name, (op, size) in STORAGE_OPERATIONS.items():
+        method = getattr(storage, method_name, None)
+        if method is not None:
+            setattr(storage, method_name, timed_operation(storage, method, backend, op, size))
+
+
+def timed_operation(storage, method, backend: str, op: str, size):
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        local.depth += 1
+        start = time.perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            local.depth -= 1
+            registry.observe("storage_operation_seconds", elapsed, backend=backend, op=op)
+            if not local.depth:
+                add_timing("storage", elapsed)
+        if size is not None:
+            registry.observe("storage_operation_bytes", size(storage, args, result), backend=backend, op=op)
+        return result
+    return wrapper
+
+
+def init_app(app: Flask):
+    """Время запросов и шаблонов, маршрут /metrics и, в режиме отладки, заголовок Server-Timing"""
+
+    @app.before_request
+    def start_request():
+        g.metrics_start = time.perf_counter()
+        local.timings = {}
+        local.renders.clear()
+
+    @app.after_request
+    def finish_request(response):
+        elapsed = time.perf_counter() - g.metrics_start
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        registry.observe("http_request_duration_seconds", elapsed,
+                         method=request.method, route=route, status=response.status_code)
+        if app.debug:
+            parts = [f"total;dur={elapsed * 1000:.2f}"]
+            parts += [f"{part};dur={seconds * 1000:.2f}" for part, seconds in local.timings.items()]
+            response.headers["Server-Timing"] = ", ".join(parts)
+        local.timings = None
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return registry.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+    def start_render(sender, template, context, **extra):
+        local.renders.append(time.perf_counter())
+
+    def finish_render(sender, template, context, **extra):
+        elapsed = time.perf_counter() - local.renders.pop()
+        registry.observe("template_render_seconds", elapsed, template=template.name)
+        if not local.renders:
+            add_timing("render", elapsed)
+
+    before_render_template.connect(start_render, app, weak=False)
+    template_rendered.connect(finish_render, app, weak=False)
@@ -0,0 +1,160 @@
+"""Пользователи и задачи в памяти.
+
+Записи со __slots__ вместо словарей: у объекта нет своего словаря атрибутов,
+поэтому задача занимает в несколько раз меньше памяти. Время создания
+хранится целым числом секунд от эпохи по часам сервера (без часового
+пояса, как его и показывает интерфейс), срок выполнения — номером дня
+(date.toordinal), время удаления в корзину — как время создания.
+
+В JSON (файлы, журнал, API) записи переводятся через from_dict и to_dict
+в прежнем виде. Поля, которых запись не знает, и значения времени не
+в том формате сохраняются в extra и возвращаются в to_dict без изменений.
+"""
+import re
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+
+EPOCH = datetime(1970, 1, 1)
+SECOND = timedelta(seconds=1)
+
+CREATED_RE = re.compile(r"\d{4}-\d\d-\d\d \d\d:\d\d:\d\d")
+DUE_RE = re.compile(r"\d{4}-\d\d-\d\d")
+
+EMAIL_RE = re.compile(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9-]+\.[a-zA-Z]{2,}$")
+PHONE_RE = re.compile(r"^8\d{10}$|^\+7\d{10}$")
+NAME_RE = re.compile(r"^[^!@#$%^&*()_+=-]*$")
+
+
+# Правила для полей пользователя: ими проверяют регистрацию (UserManager) и импорт (bulk.py)
+def is_email_valid(email: str) -> bool:
+    return EMAIL_RE.match(email) is not None
+
+
+def is_phone_valid(phone: str) -> bool:
+    return PHONE_RE.match(phone) is not None
+
+
+def is_password_valid(password: str) -> bool:
+    return len(password) >= 5 and password.isalpha()
+
+
+def is_name_valid(name: str) -> bool:
+    return NAME_RE.match(name) is not None
+
+
+def parse_created(value) -> Optional[int]:
+    """"YYYY-MM-DD HH:MM:SS" в секунды от эпохи или None"""
+    if type(value) is not str or CREATED_RE.fullmatch(value) is None:
+        return None
+    try:
+        return (datetime.fromisoformat(value) - EPOCH) // SECOND
+    except ValueError:
+        return None
+
+
+def format_created(seconds: int) -> str:
+    return (EPOCH + seconds * SECOND).isoformat(" ")
+
+
+def now_seconds() -> int:
+    return (datetime.now().replace(microsecond=0) - EPOCH) // SECOND
+
+
+def parse_due_day(value) -> Optional[int]:
+    """Срок выполнения "YYYY-MM-DD" в виде номера дня (date.toordinal) или None"""
+    if type(value) is not str or DUE_RE.fullmatch(value) is None:
+        return None
+    try:
+        return date.fromisoformat(value).toordinal()
+    except ValueError:
+        return None
+
+
+def format_due_day(day: int) -> str:
+    return date.fromordinal(day).isoformat()
+
+
+class Task:
+    __slots__ = ("id", "text", "completed", "created", "due_day", "deleted", "extra")
+
+    FIELDS = ("id", "text", "completed", "created_at", "due_date", "deleted_at")
+
+    def __init__(self, id: Optional[str], text: str, completed: bool = False,
+                 created: Optional[int] = None, due_day: Optional[int] = None, extra: Optional[Dict] = None,
+                 deleted: Optional[int] = None):
+        self.id = id
+        self.text = text
+        self.completed = completed
+        self.created = created
+        self.due_day = due_day
+        self.deleted = deleted  # только у задач в корзине
+        self.extra = extra
+
+    @property
+    def created_at(self) -> Optional[str]:
+        if self.created is not None:
+            return format_created(self.created)
+        return self.extra.get("created_at") if self.extra else None
+
+    @property
+    def due_date(self) -> Optional[str]:
+        if self.due_day is not None:
+            return format_due_day(self.due_day)
+        return self.extra.get("due_date") if self.extra else None
+
+    @property
+    def deleted_at(self) -> Optional[str]:
+        if self.deleted is not None:
+            return format_created(self.deleted)
+        return self.extra.get("deleted_at") if self.extra else None
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Task":
+        created = parse_created(data.get("created_at"))
+        due_day = parse_due_day(data.get("due_date"))
+        deleted = parse_created(data.get("deleted_at"))
+        extra = {key: value for key, value in data.items()
+                 if key not in cls.FIELDS
+                 or (key == "created_at" and created is None and value is not None)
+                 or (key == "due_date" and due_day is None and value is not None)
+                 or (key == "deleted_at" and deleted is None and value is not None)}
+        return cls(data.get("id"), data.get("text", ""), data.get("completed", False), created, due_day,
+                   extra or None, deleted)
+
+    def to_dict(self) -> Dict:
+        data = {
+            "id": self.id,
+            "text": self.text,
+            "completed": self.completed,
+            "created_at": self.created_at,
+            "due_date": self.due_date
+        }
+        # У задач не из корзины поля нет вовсе: их JSON прежний
+        if self.deleted is not None:
+            data["deleted_at"] = self.deleted_at
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __repr__(self):
+        return f"Task({self.to_dict()!r})"
+
+
+class User:
+    __slots__ = ("name", "email", "phone", "password")
+
+    def __init__(self, name: str, email: str, phone: str, password: str):
+        self.name = name
+        self.email = email
+        self.phone = phone
+        self.password = password
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "User":
+        return cls(data["name"], data["email"], data["phone"], data["password"])
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"name": self.name, "email": self.email, "phone": self.phone, "password": self.password}
+
+    def __repr__(self):
+        return f"User({self.email!r})"
@@ -0,0 +1,257 @@
+"""Сессии на сервере: в cookie только короткий случайный идентификатор.
+
+Данные сессии лежат в хранилище (в памяти процесса, в файлах или в SQLite)
+до истечения срока app.permanent_session_lifetime; срок продлевается,
+когда прошла его половина. Фоновый поток раз в sweep_interval секунд
+удаляет истёкшие сессии. Подписывать cookie не нужно: идентификатор
+нельзя подобрать, а удалённую из хранилища сессию — отозвать.
+
+Если у посетителя без сессии в ней только сообщения flash (например,
+«войдите в систему» перед редиректом), они хранятся в подписанной
+cookie, а не в хранилище: иначе каждый запрос без cookie оставлял бы
+в хранилище сессию на весь срок.
+"""
+import logging
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from flask.sessions import SecureCookieSession, SessionInterface, session_json_serializer
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+SID_RE = re.compile(r"[A-Za-z0-9_-]{22}")
+FLASH_KEYS = {"_flashes"}  # ключи сессии, которые Flask заводит для flash()
+
+logger = logging.getLogger(__name__)
+
+
+def new_sid() -> str:
+    return secrets.token_urlsafe(16)
+
+
+class MemorySessionStore:
+    """Сессии в памяти процесса: при нескольких процессах у каждого свои"""
+
+    blocking = False  # можно вызывать прямо из цикла событий (asgi.py)
+
+    def __init__(self):
+        self.sessions: Dict[str, Tuple[str, float]] = {}
+        self.lock = threading.Lock()
+
+    def load(self, sid: str) -> Optional[Tuple[dict, float]]:
+        """(данные, срок) или None, если сессии нет или она истекла"""
+        entry = self.sessions.get(sid)
+        if entry is None or entry[1] <= time.time():
+            return None
+        return session_json_serializer.loads(entry[0]), entry[1]
+
+    def save(self, sid: str, data: dict, expires: float):
+        with self.lock:
+            self.sessions[sid] = (session_json_serializer.dumps(data), expires)
+
+    def delete(self, sid: str):
+        with self.lock:
+            self.sessions.pop(sid, None)
+
+    def sweep(self, now: float) -> int:
+        with self.lock:
+            expired = [sid for sid, (_, expires) in self.sessions.items() if expires <= now]
+            for sid in expired:
+                del self.sessions[sid]
+        return len(expired)
+
+
+class FileSessionStore:
+    """Файл на сессию; срок хранится во времени изменения файла, поэтому очистке хватает stat"""
+
+    blocking = True
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, sid: str) -> str:
+        return os.path.join(self.directory, sid + ".json")
+
+    def load(self, sid: str) -> Optional[Tuple[dict, float]]:
+        try:
+            with open(self._path(sid), "r", encoding="utf-8") as f:
+                expires = os.fstat(f.fileno()).st_mtime
+                if expires <= time.time():
+                    return None
+                return session_json_serializer.loads(f.read()), expires
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, sid: str, data: dict, expires: float):
+        path = self._path(sid)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(session_json_serializer.dumps(data))
+        os.utime(tmp_path, (expires, expires))
+        os.replace(tmp_path, path)
+
+    def delete(self, sid: str):
+        try:
+            os.remove(self._path(sid))
+        except FileNotFoundError:
+            pass
+
+    def sweep(self, now: float) -> int:
+        removed = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.name.endswith(".json") and entry.stat().st_mtime <= now:
+                        os.remove(entry.path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+
+class SqliteSessionStore:
+    """Сессии в таблице SQLite: общие для всех процессов"""
+
+    blocking = True
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            sid TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            expires REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS sessions_by_expires ON sessions (expires);
+    """
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self.connections = threading.local()
+        self.conn.executescript(self.SCHEMA)
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """Своё соединение у каждого потока (и у процесса после fork)"""
+        if getattr(self.connections, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.db_file, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.connections.conn = conn
+            self.connections.pid = os.getpid()
+        return self.connections.conn
+
+    def load(self, sid: str) -> Optional[Tuple[dict, float]]:
+        row = self.conn.execute("SELECT data, expires FROM sessions WHERE sid = ? AND expires > ?",
+                                (sid, time.time())).fetchone()
+        return None if row is None else (session_json_serializer.loads(row[0]), row[1])
+
+    def save(self, sid: str, data: dict, expires: float):
+        self.conn.execute("INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)",
+                          (sid, session_json_serializer.dumps(data), expires))
+
+    def delete(self, sid: str):
+        self.conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def sweep(self, now: float) -> int:
+        return self.conn.execute("DELETE FROM sessions WHERE expires <= ?", (now,)).rowcount
+
+
+class ServerSession(SecureCookieSession):
+    def __init__(self, initial=None, sid: str = None, touched: bool = False):
+        super().__init__(initial)
+        self.sid = sid
+        self.touched = touched  # срок пора продлить
+        self.regenerated = False
+        self.in_cookie = False  # только сообщения flash, прочитанные из подписанной cookie
+
+    def regenerate(self):
+        """Новый идентификатор с теми же данными, старая сессия удаляется — при входе и выходе"""
+        self.regenerated = True
+        self.modified = True
+
+
+class ServerSessionInterface(SessionInterface):
+    def __init__(self, store, lifetime: float, sweep_interval: float = 600):
+        self.store = store
+        self.lifetime = lifetime
+        self.sweep_interval = sweep_interval
+        self.sweeper: Optional[threading.Thread] = None
+
+    def load(self, sid: Optional[str]) -> Optional[ServerSession]:
+        """Сессия по идентификатору из cookie или None"""
+        if not sid or SID_RE.fullmatch(sid) is None:
+            return None
+        loaded = self.store.load(sid)
+        if loaded is None:
+            return None
+        data, expires = loaded
+        return ServerSession(data, sid, touched=expires - time.time() < self.lifetime / 2)
+
+    def save(self, session: ServerSession) -> bool:
+        """Сохраняет сессию, если нужно; True — у сессии новый идентификатор и cookie надо выставить"""
+        if self.sweeper is None:
+            self.sweeper = threading.Thread(target=self._sweep, daemon=True)
+            self.sweeper.start()
+        if session.regenerated and session.sid is not None:
+            self.store.delete(session.sid)
+            session.sid = None
+        is_new = session.sid is None
+        if is_new:
+            session.sid = new_sid()
+        if is_new or session.modified or session.touched:
+            self.store.save(session.sid, dict(session), time.time() + self.lifetime)
+        return is_new
+
+    def _sweep(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.store.sweep(time.time())
+            except Exception:
+                logger.exception("Не удалось удалить истёкшие сессии")
+
+    def flash_serializer(self, app) -> URLSafeTimedSerializer:
+        return URLSafeTimedSerializer(app.secret_key, salt="flash-session", serializer=session_json_serializer)
+
+    def open_session(self, app, request) -> ServerSession:
+        value = request.cookies.get(self.get_cookie_name(app))
+        session = self.load(value)
+        if session is None and value and SID_RE.fullmatch(value) is None:
+            try:
+                session = ServerSession(self.flash_serializer(app).loads(value, max_age=self.lifetime))
+                session.in_cookie = True
+            except BadSignature:
+                pass
+        return session or ServerSession()
+
+    def save_session(self, app, session: ServerSession, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+        if session.accessed:
+            response.vary.add("Cookie")
+        if not session:
+            # Пустая сессия не хранится; анонимный посетитель ничего не стоит
+            if session.sid is not None:
+                self.store.delete(session.sid)
+            if session.sid is not None or session.in_cookie:
+                response.delete_cookie(name, domain=domain, path=path, secure=secure, samesite=samesite,
+                                       httponly=httponly)
+            return
+        if session.sid is None and session.keys() <= FLASH_KEYS:
+            # Только сообщения у посетителя без сессии: хранилище ради них не занимается
+            if session.modified or not session.in_cookie:
+                response.set_cookie(name, self.flash_serializer(app).dumps(dict(session)),
+                                    expires=self.get_expiration_time(app, session),
+                                    httponly=httponly, domain=domain, path=path, secure=secure, samesite=samesite)
+            return
+        if self.save(session):
+            response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                                httponly=httponly, domain=domain, path=path, secure=secure, samesite=samesite)
@@ -0,0 +1,357 @@
+"""Компактный двоичный формат снимков задач и корзины: {email: [task, ...]}.
+
+Файл:
+    MAGIC
+    разделы пользователей подряд
+    оглавление: u32 число пользователей, u32 длина блока email,
+                email в UTF-8 подряд, их длины в символах (u32),
+                смещения разделов (u64, на одно больше числа пользователей)
+    u64 смещение оглавления, MAGIC
+
+Оглавление лежит в конце, поэтому файл пишется потоком, а читается через
+mmap: чтобы получить задачи одного пользователя, декодируется только его раздел.
+
+Раздел пользователя хранит задачи по столбцам. Имена полей записываются
+один раз на раздел, у каждой задачи — номер набора полей. Столбец
+кодируется по типу значений: id из шестнадцатеричных цифр — байтами,
+даты и время — целыми числами, флаги — байтами, строки — одним блоком
+UTF-8 с длинами, всё остальное — JSON. Поэтому данные переводятся
+в JSON и обратно без потерь, включая порядок полей.
+
+Перенос: python snapshot.py import users_tasks.json users_tasks.bin
+         python snapshot.py export users_tasks.bin users_tasks.json
+"""
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from itertools import accumulate
+from typing import Dict, Iterable, List, Tuple
+
+from records import Task, format_created, format_due_day, parse_created, parse_due_day
+
+MAGIC = b"TSK1"
+
+BOOL, HEX, DATETIME, DATE, STR, JSON = range(6)
+
+NO_DATETIME = -2 ** 63  # None в столбце времени
+NO_DATE = 0  # None в столбце дат: номера дней начинаются с 1
+
+HEX_RE = re.compile(r"(?:[0-9a-f]{2})+")
+
+# Поля времени Task: тип столбца, в котором они хранятся числами, и разбор строки в число
+TIME_FIELDS = {"created_at": (DATETIME, parse_created), "due_date": (DATE, parse_due_day),
+               "deleted_at": (DATETIME, parse_created)}
+
+MISSING = object()  # поля нет у задачи
+
+
+def _pack_array(typecode: str, values) -> bytes:
+    packed = array(typecode, values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _unpack_array(typecode: str, data) -> array:
+    unpacked = array(typecode)
+    unpacked.frombytes(data)
+    if sys.byteorder == "big":
+        unpacked.byteswap()
+    return unpacked
+
+
+def _pack_strings(values: List[str]) -> bytes:
+    """u32 число строк, u32 длина блока, блок UTF-8, длины строк в символах (u32)"""
+    blob = "".join(values).encode("utf-8")
+    return (struct.pack("<II", len(values), len(blob)) + blob
+            + _pack_array("I", [len(value) for value in values]))
+
+
+def _unpack_strings(data, pos: int = 0) -> Tuple[List[str], int]:
+    """Строки и позиция сразу за ними"""
+    count, size = struct.unpack_from("<II", data, pos)
+    pos += 8
+    text = bytes(data[pos:pos + size]).decode("utf-8")
+    pos += size
+    ends = list(accumulate(_unpack_array("I", data[pos:pos + 4 * count])))
+    return [text[start:end] for start, end in zip([0] + ends, ends)], pos + 4 * count
+
+
+def _encode_column(values: list) -> Tuple[int, bytes]:
+    if all(value is True or value is False for value in values):
+        return BOOL, bytes(values)
+    strings = [value for value in values if value is not None]
+    if all(type(value) is str for value in strings):
+        width = len(strings[0]) if strings else 0
+        if (len(strings) == len(values) and width
+                and all(len(value) == width and HEX_RE.fullmatch(value) for value in values)):
+            return HEX, struct.pack("<I", width // 2) + b"".join(bytes.fromhex(value) for value in values)
+        seconds = [NO_DATETIME if value is None else parse_created(value) for value in values]
+        if None not in seconds:
+            return DATETIME, _pack_array("q", seconds)
+        days = [NO_DATE if value is None else parse_due_day(value) for value in values]
+        if None not in days:
+            return DATE, _pack_array("i", days)
+        if len(strings) == len(values):
+            return STR, _pack_strings(values)
+    return JSON, _pack_strings([json.dumps(value, ensure_ascii=False) for value in values])
+
+
+def _decode_column(kind: int, data) -> list:
+    if kind == BOOL:
+        return [byte == 1 for byte in bytes(data)]
+    if kind == HEX:
+        width = struct.unpack_from("<I", data)[0] * 2
+        digits = bytes(data[4:]).hex()
+        return [digits[i:i + width] for i in range(0, len(digits), width)]
+    if kind == DATETIME:
+        values = _unpack_array("q", data)
+        # Даты и время у задач пользователя часто совпадают: каждое значение переводится один раз
+        strings = {value: None if value == NO_DATETIME else format_created(value)
+                   for value in set(values)}
+        return [strings[value] for value in values]
+    if kind == DATE:
+        values = _unpack_array("i", data)
+        strings = {value: None if value == NO_DATE else format_due_day(value)
+                   for value in set(values)}
+        return [strings[value] for value in values]
+    strings, _ = _unpack_strings(data)
+    return strings if kind == STR else [json.loads(value) for value in strings]
+
+
+def _decode_numbers(kind: int, data) -> list:
+    """Столбец времени или дат числами, как их хранит Task; None — значения нет"""
+    missing = NO_DATETIME if kind == DATETIME else NO_DATE
+    return [None if value == missing else value for value in _unpack_array("q" if kind == DATETIME else "i", data)]
+
+
+def _read_header(data):
+    """(число задач, имена полей, наборы полей, номера наборов или None, начало столбцов)"""
+    count, = struct.unpack_from("<I", data)
+    keys, pos = _unpack_strings(data, 4)
+    shape_count, = struct.unpack_from("<I", data, pos)
+    pos += 4
+    shapes = []
+    for _ in range(shape_count):
+        size, = struct.unpack_from("<I", data, pos)
+        pos += 4
+        shapes.append(tuple(keys[i] for i in _unpack_array("I", data[pos:pos + 4 * size])))
+        pos += 4 * size
+    task_shapes = None
+    if shape_count > 1:
+        task_shapes = _unpack_array("I", data[pos:pos + 4 * count])
+        pos += 4 * count
+    return count, keys, shapes, task_shapes, pos
+
+
+def _decode_section(data, numbers: Dict[str, int] = None):
+    """(число задач, наборы полей, номера наборов или None, столбцы, имена столбцов, прочитанных числами).
+
+    Столбцы из numbers ({имя: тип}) того же типа читаются _decode_numbers.
+    """
+    data = memoryview(data)
+    count, keys, shapes, task_shapes, pos = _read_header(data)
+    columns = {}
+    numeric = set()
+    for key in keys:
+        kind, size = struct.unpack_from("<BI", data, pos)
+        pos += 5
+        if numbers and numbers.get(key) == kind:
+            columns[key] = _decode_numbers(kind, data[pos:pos + size])
+            numeric.add(key)
+        else:
+            columns[key] = _decode_column(kind, data[pos:pos + size])
+        pos += size
+    return count, shapes, task_shapes, columns, numeric
+
+
+def has_task_ids(data) -> bool:
+    """Есть ли id у всех задач раздела; остальные столбцы не декодируются"""
+    data = memoryview(data)
+    count, keys, shapes, _, pos = _read_header(data)
+    if not count:
+        return True
+    if not all("id" in shape for shape in shapes):
+        return False
+    for key in keys:
+        kind, size = struct.unpack_from("<BI", data, pos)
+        pos += 5
+        if key == "id":
+            # В столбцах байтов и строк None не бывает
+            return kind in (BOOL, HEX, STR) or None not in _decode_column(kind, data[pos:pos + size])
+        pos += size
+    return False
+
+
+def encode_tasks(tasks: List[Dict]) -> bytes:
+    """Раздел пользователя: u32 число задач, имена полей, наборы полей, номера наборов, столбцы"""
+    keys: Dict[str, int] = {}
+    shapes: Dict[Tuple[int, ...], int] = {}
+    task_shapes = []
+    columns: Dict[str, list] = {}
+    for task in tasks:
+        shape = tuple(keys.setdefault(key, len(keys)) for key in task)
+        task_shapes.append(shapes.setdefault(shape, len(shapes)))
+        for key, value in task.items():
+            columns.setdefault(key, []).append(value)
+
+    parts = [struct.pack("<I", len(tasks)), _pack_strings(list(keys)), struct.pack("<I", len(shapes))]
+    for shape in shapes:
+        parts.append(struct.pack("<I", len(shape)) + _pack_array("I", shape))
+    if len(shapes) > 1:
+        parts.append(_pack_array("I", task_shapes))
+    for key in keys:
+        kind, payload = _encode_column(columns[key])
+        parts.append(struct.pack("<BI", kind, len(payload)) + payload)
+    return b"".join(parts)
+
+
+def decode_tasks(data) -> List[Dict]:
+    count, shapes, task_shapes, columns, _ = _decode_section(data)
+    if task_shapes is None:
+        if not shapes or not shapes[0]:
+            return [{} for _ in range(count)]
+        # Обычный случай: у всех задач одни и те же поля
+        return [dict(zip(shapes[0], row)) for row in zip(*(columns[key] for key in shapes[0]))]
+    values = {key: iter(column) for key, column in columns.items()}
+    return [{key: next(values[key]) for key in shapes[number]} for number in task_shapes]
+
+
+def decode_task_records(data) -> List[Task]:
+    """То же, что map(Task.from_dict, decode_tasks(data)), но без строк посередине:
+    время и сроки из столбцов чисел сразу становятся полями Task."""
+    count, shapes, task_shapes, columns, numeric = _decode_section(
+        data, {key: kind for key, (kind, _) in TIME_FIELDS.items()})
+    if task_shapes is None:
+        task_shapes = [0] * count
+    else:
+        # У задач разные наборы полей: столбцы дополняются до числа задач
+        values = {key: iter(column) for key, column in columns.items()}
+        has = [set(shape) for shape in shapes]
+        columns = {key: [next(column) if key in has[number] else MISSING for number in task_shapes]
+                   for key, column in values.items()}
+
+    def field(key: str, default) -> list:
+        column = columns.get(key)
+        if column is None:
+            return [default] * count
+        return [default if value is MISSING else value for value in column]
+
+    ids, texts, completed = field("id", None), field("text", ""), field("completed", False)
+    times = {}
+    odd = set()  # строки времени не в том формате: как и from_dict, Task хранит их в extra
+    for key, (_, parse) in TIME_FIELDS.items():
+        column = field(key, None)
+        if key not in numeric and key in columns:
+            column = [None if value is None else parse(value) for value in column]
+            odd.update((key, i) for i, value in enumerate(columns[key])
+                       if column[i] is None and value is not None and value is not MISSING)
+        times[key] = column
+    extras = [None] * count
+    if odd or any(key not in Task.FIELDS for key in columns):
+        for i, number in enumerate(task_shapes):
+            extra = {key: columns[key][i] for key in shapes[number]
+                     if key not in Task.FIELDS or (key, i) in odd}
+            extras[i] = extra or None
+    return [Task(*fields) for fields in zip(ids, texts, completed, times["created_at"], times["due_date"],
+                                            extras, times["deleted_at"])]
+
+
+def write_snapshot(f, sections: Iterable[Tuple[str, bytes]]) -> Dict[str, Tuple[int, int]]:
+    """Пишет снимок из готовых разделов в открытый двоичный файл, возвращает {email: (начало, конец)}"""
+    f.write(MAGIC)
+    emails, offsets = [], [len(MAGIC)]
+    for email, section in sections:
+        f.write(section)
+        emails.append(email)
+        offsets.append(offsets[-1] + len(section))
+    f.write(_pack_strings(emails))
+    f.write(_pack_array("Q", offsets))
+    f.write(struct.pack("<Q", offsets[-1]) + MAGIC)
+    return dict(zip(emails, zip(offsets, offsets[1:])))
+
+
+class SnapshotReader:
+    """Снимок, отображённый в память. sections — {email: (начало, конец)} раздела пользователя."""
+
+    def __init__(self, filename: str):
+        self.file = open(filename, "rb")
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            footer = len(self.map) - 8 - len(MAGIC)
+            if footer < len(MAGIC) or self.map[:len(MAGIC)] != MAGIC or self.map[-len(MAGIC):] != MAGIC:
+                raise ValueError(f"{filename} не является снимком задач")
+            directory, = struct.unpack_from("<Q", self.map, footer)
+            emails, pos = _unpack_strings(self.map, directory)
+            offsets = _unpack_array("Q", self.map[pos:pos + 8 * (len(emails) + 1)])
+        except (ValueError, struct.error):
+            self.file.close()
+            raise ValueError(f"{filename} не является снимком задач")
+        self.sections = dict(zip(emails, zip(offsets, offsets[1:])))
+
+    def fileno(self) -> int:
+        return self.file.fileno()
+
+    def read(self, start: int, end: int) -> bytes:
+        return self.map[start:end]
+
+    def has_ids(self, email: str) -> bool:
+        """Есть ли id у всех задач пользователя; раздел не копируется из отображения"""
+        start, end = self.sections[email]
+        with memoryview(self.map) as view:
+            return has_task_ids(view[start:end])
+
+    def tasks(self, email: str) -> List[Dict]:
+        start, end = self.sections[email]
+        return decode_tasks(self.read(start, end))
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+def load_snapshot(filename: str) -> Dict[str, List[Dict]]:
+    reader = SnapshotReader(filename)
+    try:
+        return {email: reader.tasks(email) for email in reader.sections}
+    finally:
+        reader.close()
+
+
+def save_snapshot(data: Dict[str, List[Dict]], filename: str):
+    with open(filename + ".tmp", "wb") as f:
+        write_snapshot(f, ((email, encode_tasks(tasks)) for email, tasks in data.items()))
+    os.replace(filename + ".tmp", filename)
+
+
+if __name__ == "__main__":
+    # python snapshot.py import users_tasks.json users_tasks.bin
+    # python snapshot.py export users_tasks.bin users_tasks.json
+    if len(sys.argv) != 4 or sys.argv[1] not in ("import", "export"):
+        print("Использование: python snapshot.py import|export <откуда> <куда>")
+        sys.exit(1)
+    command, source, target = sys.argv[1:]
+    if command == "import":
+        with open(source, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        from storage import new_task_id
+        # Задачам без id (данные, созданные до их появления) id присваивается здесь,
+        # а не при каждом открытии снимка
+        for tasks in data.values():
+            for task in tasks:
+                if task.get("id") is None:
+                    task["id"] = new_task_id()
+        save_snapshot(data, target)
+        if load_snapshot(target) != data:
+            print(f"❌ Снимок {target} не совпадает с {source}")
+            sys.exit(1)
+    else:
+        data = load_snapshot(source)
+        with open(target + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+        os.replace(target + ".tmp", target)
+    print(f"✅ Перенесено пользователей: {len(data)}, задач: {sum(len(tasks) for tasks in data.values())}")
@@ -0,0 +1,1496 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import islice
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from records import Task, User, parse_created
+from snapshot import SnapshotReader, decode_task_records, encode_tasks, write_snapshot
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка между процессами недоступна
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+last_id_stamp = 0
+id_lock = threading.Lock()
+
+
+def new_task_id() -> str:
+    """Уникальный идентификатор задачи: время в микросекундах и случайный хвост.
+
+    Новые id возрастают, поэтому задачи, созданные в одну секунду,
+    идут в порядке добавления (indexes.created_key) в любом процессе.
+    """
+    global last_id_stamp
+    with id_lock:
+        stamp = last_id_stamp = max(time.time_ns() // 1000, last_id_stamp + 1)
+    return f"{stamp:014x}{secrets.token_hex(3)}"
+
+
+def index_tasks(data: Dict[str, List[Dict]]) -> Tuple[Dict[str, Dict[str, Task]], bool]:
+    """Переводит {email: [task, ...]} из JSON в {email: {id: Task}}.
+
+    Задачам без id (данные, созданные до их появления) присваивается новый id.
+    Второе значение — были ли присвоены новые id.
+    """
+    indexed = {}
+    changed = False
+    for email, tasks in data.items():
+        indexed[email], assigned = index_user_tasks(map(Task.from_dict, tasks))
+        changed = changed or assigned
+    return indexed, changed
+
+
+def index_user_tasks(tasks: Iterable[Task]) -> Tuple[Dict[str, Task], bool]:
+    """index_tasks для задач одного пользователя, уже переведённых в Task"""
+    user_tasks = {}
+    changed = False
+    for task in tasks:
+        if task.id is None:
+            task.id = new_task_id()
+            changed = True
+        user_tasks[task.id] = task
+    return user_tasks, changed
+
+
+def unindex_tasks(data: Dict[str, Dict[str, Task]]) -> Dict[str, List[Dict]]:
+    """Обратное к index_tasks: формат, в котором задачи лежат в JSON-файлах"""
+    return {email: dump_tasks(tasks) for email, tasks in data.items()}
+
+
+def dump_tasks(tasks: Dict[str, Task]) -> List[Dict]:
+    return [task.to_dict() for task in tasks.values()]
+
+
+def load_users(data: List[Dict]) -> List[User]:
+    return [User.from_dict(user) for user in data]
+
+
+def dump_users(users: List[User]) -> List[Dict]:
+    return [user.to_dict() for user in users]
+
+
+def sync_dir(filename: str):
+    """Сбрасывает на диск папку файла, чтобы переименование в ней пережило сбой питания"""
+    if not hasattr(os, "O_DIRECTORY"):  # Windows: папку так не открыть
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(filename)), os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def file_version(filename: str, stat: os.stat_result = None):
+    """Признак версии файла: меняется при каждой атомарной перезаписи"""
+    try:
+        stat = stat or os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class ProcessLock:
+    """Блокировка между процессами через flock на отдельном файле.
+
+    Повторный захват тем же потоком не блокирует, как у RLock.
+    Без fcntl (Windows) защищает только потоки текущего процесса.
+
+    Пока kept=True, при выходе из with отпускается только блокировка
+    между потоками, а другие процессы ждут, пока владелец не сбросит
+    kept внутри with (так отложенная запись не даёт другим процессам
+    перезаписать файл поверх несохранённых изменений).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.RLock()
+        self.depth = 0
+        self.owner = None
+        self.file = None
+        self.pid = None
+        self.kept = False
+
+    def held(self) -> bool:
+        """Захвачена ли блокировка текущим потоком"""
+        return self.owner == threading.get_ident()
+
+    def __enter__(self):
+        self.lock.acquire()
+        self.depth += 1
+        if self.depth == 1:
+            self.owner = threading.get_ident()
+            if fcntl is not None:
+                # После fork дескриптор, а вместе с ним и блокировка, общие с родителем
+                if self.pid != os.getpid():
+                    self.file = open(self.path, "a")
+                    self.pid = os.getpid()
+                fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        self.depth -= 1
+        if self.depth == 0:
+            self.owner = None
+            if fcntl is not None and not self.kept:
+                fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.lock.release()
+
+
+class ThreadState(threading.local):
+    """Состояние хранилища, своё у каждого потока"""
+
+    def __init__(self):
+        self.batch_depth = 0
+        self.dirty = set()
+        self.held = []
+
+
+class Storage:
+    """Интерфейс хранилища пользователей, задач и корзины для UserManager.
+
+    UserManager держит данные в памяти и после каждого изменения
+    сообщает хранилищу, что именно изменилось. Задачи каждого пользователя
+    хранятся в словаре {id: task} в порядке добавления.
+
+    UserManager обращается к данным пользователя внутри read(email) или
+    write(email): они подхватывают изменения других процессов (refresh)
+    и держат блокировку пользователя, а write — ещё и блокировку между
+    процессами (process_lock). email=None — список пользователей.
+    Вложенные read/write в одном потоке не допускаются.
+    """
+
+    def __init__(self, process_lock=None):
+        self.process_lock = process_lock or ProcessLock(os.devnull)
+        self.user_locks: Dict[Optional[str], threading.RLock] = {}
+        self.user_locks_guard = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.local = ThreadState()
+        # on_change(emails, users) вызывается, когда refresh подхватил чужие изменения:
+        # emails — пользователи с изменёнными задачами (None — все),
+        # users — новые пользователи (None — список перечитан целиком)
+        self.on_change: Optional[Callable[[Optional[Set[str]], Optional[List[User]]], None]] = None
+
+    @property
+    def batch_depth(self) -> int:
+        return self.local.batch_depth
+
+    @contextmanager
+    def batch(self):
+        """Изменения внутри блока сохраняются один раз — при выходе из внешнего блока"""
+        with self.process_lock:
+            self.local.batch_depth += 1
+            try:
+                yield
+            finally:
+                self.local.batch_depth -= 1
+                if self.local.batch_depth == 0:
+                    self.flush()
+
+    def flush(self):
+        """Сохраняет изменения, накопленные внутри batch()"""
+        pass
+
+    def user_lock(self, email: Optional[str]):
+        with self.user_locks_guard:
+            lock = self.user_locks.get(email)
+            if lock is None:
+                lock = self.user_locks[email] = threading.RLock()
+        return lock
+
+    @contextmanager
+    def read(self, email: Optional[str]):
+        self._refresh()
+        with self.user_lock(email):
+            self._open_user(email)
+            yield
+
+    @contextmanager
+    def write(self, email: Optional[str]):
+        with self.process_lock:
+            self._refresh()
+            with self.user_lock(email):
+                self._open_user(email)
+                yield
+
+    def _open_user(self, email: Optional[str]):
+        """Вызывается под блокировкой пользователя перед обращением к его данным"""
+        pass
+
+    def peek_user(self, email: str) -> Tuple[List[Task], List[Task]]:
+        """Задачи и корзина пользователя для выгрузки. Хранилища, которые читают
+        задачи при первом обращении, не оставляют непрочитанные задачи в памяти."""
+        self._refresh()
+        with self.user_lock(email):
+            return self._peek_user(email)
+
+    def _peek_user(self, email: str) -> Tuple[List[Task], List[Task]]:
+        self._open_user(email)
+        return list(self.tasks.get(email, {}).values()), list(self.trash.get(email, {}).values())
+
+    def _refresh(self):
+        with self.refresh_lock:
+            if not self.refresh():
+                return
+        # refresh попросил process_lock: другие процессы не должны писать, пока он работает
+        with self.process_lock:
+            with self.refresh_lock:
+                self.refresh()
+
+    def refresh(self) -> Optional[bool]:
+        """Подхватывает изменения других процессов.
+
+        Возвращает True, если для этого нужен process_lock, а он не захвачен.
+        """
+        pass
+
+    def _notify(self, emails: Optional[Set[str]], users: Optional[List[User]]):
+        if self.on_change is not None:
+            self.on_change(emails, users)
+
+    def load(self) -> Tuple[List[User], Dict[str, Dict[str, Task]], Dict[str, Dict[str, Task]]]:
+        """Возвращает (users, tasks, trash)"""
+        raise NotImplementedError
+
+    def add_user(self, user: User):
+        raise NotImplementedError
+
+    def ensure_user(self, email: str):
+        """Вызывается при входе пользователя, у которого ещё нет списка задач"""
+        raise NotImplementedError
+
+    def add_task(self, email: str, task: Task):
+        raise NotImplementedError
+
+    def update_task(self, email: str, task: Task):
+        raise NotImplementedError
+
+    def delete_task(self, email: str, task: Task):
+        """Задача перенесена из списка задач в корзину"""
+        raise NotImplementedError
+
+    def restore_task(self, email: str, task: Task):
+        """Задача перенесена из корзины обратно в список задач"""
+        raise NotImplementedError
+
+    def empty_trash(self, email: str):
+        raise NotImplementedError
+
+    def purge_tasks(self, email: str, tasks: List[Task]):
+        """Задачи удалены из корзины насовсем (очистка по сроку хранения)"""
+        raise NotImplementedError
+
+
+DURABILITY_LEVELS = ("none", "file", "full")
+
+
+class JsonStorage(Storage):
+    """Хранение в трёх JSON-файлах. Каждое изменение перезаписывает файл целиком.
+
+    Файлы заменяются атомарно (запись во временный файл и переименование),
+    поэтому другие процессы замечают замену по inode, mtime и размеру
+    и перечитывают только изменившийся файл.
+
+    При запуске файлы только открываются. Список пользователей разбирается
+    при первом обращении к нему, а задачи пользователя — при первом
+    обращении к ним, по смещениям из индекса <файл>.idx, который
+    сохраняется вместе с файлом задач. Задачи, которые не читались,
+    при сохранении копируются из старого файла без разбора. Если индекса
+    нет или он от другой версии файла, файл читается целиком.
+
+    С binary=True задачи и корзина хранятся в двоичных снимках (snapshot.py):
+    файл отображается в память, смещения берутся из его оглавления,
+    отдельный индекс не нужен.
+
+    С flush_interval > 0 изменения сохраняются не сразу, а фоновым потоком
+    не чаще раза в flush_interval секунд и при выходе из процесса (close):
+    серия изменений от всех пользователей перезаписывает каждый файл один
+    раз. До сохранения process_lock остаётся захваченным (ProcessLock.kept),
+    поэтому другие процессы ждут его, чтобы записать свои изменения, а их
+    чтение видит данные на момент последнего сохранения.
+
+    durability — что сбрасывается на диск при сохранении: none — ничего
+    (файл переживёт падение процесса, но не сбой питания), file — файлы
+    перед переименованием, full — ещё и папка после переименования.
+    """
+
+    def __init__(self, users_file: str, tasks_file: str, trash_file: str, binary: bool = False,
+                 flush_interval: float = 0, durability: str = "none"):
+        super().__init__(ProcessLock(tasks_file + ".lock"))
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f"durability должно быть одним из {DURABILITY_LEVELS}: {durability!r}")
+        self.users_file = users_file
+        self.tasks_file = tasks_file
+        self.trash_file = trash_file
+        self.binary = binary
+        self.flush_interval = flush_interval
+        self.durability = durability
+        self.flush_requested = threading.Event()
+        self.writer: Optional[threading.Thread] = None
+        self.dirty = set()
+        self.versions = {}
+        self.lock = threading.RLock()
+        self.users_loaded = False
+        self.files = {"tasks": tasks_file, "trash": trash_file}
+        self.handles = {}  # открытые файлы задач: из них читаются задачи пользователей
+        self.offsets: Dict[str, Optional[Dict[str, List[int]]]] = {}  # None — файл прочитан целиком
+        self.opened = {"tasks": set(), "trash": set()}
+
+    def user_lock(self, email: Optional[str]):
+        # Файл задач сохраняется целиком, поэтому блокировка одна на всех пользователей
+        return self.lock
+
+    def load(self):
+        with self.process_lock:
+            self.users, self.tasks, self.trash = [], {}, {}
+            self.task_maps = {"tasks": self.tasks, "trash": self.trash}
+            for name in self.files:
+                if self._open_file(name):
+                    # Присвоенные при загрузке id сразу сохраняются, чтобы не меняться
+                    # между запусками; заодно сохраняется индекс
+                    self._save_file(name)
+        return self.users, self.tasks, self.trash
+
+    def _open_file(self, name: str) -> bool:
+        """Открывает файл задач заново. True — файл прочитан целиком и его стоит пересохранить."""
+        filename = self.files[name]
+        data = self.task_maps[name]
+        data.clear()
+        self.opened[name].clear()
+        if name in self.handles:
+            self.handles.pop(name).close()
+        try:
+            handle = SnapshotReader(filename) if self.binary else open(filename, "rb")
+        except FileNotFoundError:
+            self.versions[filename] = None
+            self.offsets[name] = {}
+            return False
+        if self.binary:
+            self.versions[filename] = file_version(filename, os.fstat(handle.fileno()))
+            self.handles[name] = handle
+            self.offsets[name] = handle.sections
+            # Снимок из данных без id: id присваиваются сразу, чтобы файл пересохранили
+            # с ними и они не менялись от открытия к открытию
+            missing = [email for email in handle.sections if not handle.has_ids(email)]
+            for email in missing:
+                self._open_section(name, email)
+            return bool(missing)
+        version = self.versions[filename] = file_version(filename, os.fstat(handle.fileno()))
+        offsets = self._load_offsets(filename, version)
+        if offsets is not None:
+            self.handles[name] = handle
+            self.offsets[name] = offsets
+            return False
+        self.offsets[name] = None
+        with handle:
+            try:
+                loaded, _ = index_tasks(json.load(handle))
+            except json.JSONDecodeError:
+                return False
+        data.update(loaded)
+        return True
+
+    def _load_offsets(self, filename: str, version) -> Optional[Dict[str, List[int]]]:
+        try:
+            with open(filename + ".idx", "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return index["offsets"] if tuple(index["version"]) == version else None
+
+    def _open_user(self, email: Optional[str]):
+        if email is None:
+            if not self.users_loaded:
+                self.users[:] = load_users(self._load_data(self.users_file, default=[]))
+                self.users_loaded = True
+                self._notify(set(), None)
+            return
+        for name in self.task_maps:
+            self._open_section(name, email)
+
+    def _open_section(self, name: str, email: str):
+        offsets = self.offsets[name]
+        if offsets is None or email in self.opened[name]:
+            return
+        self.opened[name].add(email)
+        if email in offsets:
+            data = self.task_maps[name]
+            if self.binary:
+                data[email], assigned = index_user_tasks(decode_task_records(self._read_chunk(name, email)))
+                if assigned:
+                    # id, присвоенные вне load(), сохранятся со следующей записью
+                    self.dirty.add(name)
+            else:
+                tasks = map(Task.from_dict, json.loads(self._read_chunk(name, email)))
+                data[email] = {task.id: task for task in tasks}
+
+    def _peek_user(self, email: str):
+        peeked = []
+        for name, data in self.task_maps.items():
+            offsets = self.offsets[name]
+            if offsets is None or email in self.opened[name] or email not in offsets:
+                peeked.append(list(data.get(email, {}).values()))
+            elif self.binary:
+                peeked.append(decode_task_records(self._read_chunk(name, email)))
+            else:
+                peeked.append(list(map(Task.from_dict, json.loads(self._read_chunk(name, email)))))
+        return peeked[0], peeked[1]
+
+    def open_all(self):
+        """Читает всех пользователей и все задачи сразу, например для переноса в другое хранилище"""
+        with self.lock:
+            self._open_user(None)
+            for offsets in list(self.offsets.values()):
+                for email in list(offsets or ()):
+                    self._open_user(email)
+
+    def _read_chunk(self, name: str, email: str) -> bytes:
+        """Неразобранные задачи пользователя из открытого файла"""
+        start, end = self.offsets[name][email]
+        handle = self.handles[name]
+        if self.binary:
+            return handle.read(start, end)
+        handle.seek(start)
+        return handle.read(end - start)
+
+    def _load_data(self, filename: str, default):
+        try:
+            with open(filename, "r", encoding="utf-8") as f:
+                self.versions[filename] = file_version(filename, os.fstat(f.fileno()))
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return default
+
+    def _save_data(self, data, filename: str):
+        with open(filename + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+            self._sync(f)
+        self._replace(filename + ".tmp", filename)
+        self.versions[filename] = file_version(filename)
+
+    def _sync(self, f):
+        """Вызывается перед закрытием временного файла"""
+        if self.durability != "none":
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _replace(self, tmp_file: str, filename: str):
+        os.replace(tmp_file, filename)
+        if self.durability == "full":
+            sync_dir(filename)
+
+    def _save_file(self, name: str):
+        """Сохраняет файл задач и его индекс"""
+        if self.binary:
+            return self._save_snapshot(name)
+        filename = self.files[name]
+        data = self.task_maps[name]
+        old_offsets = self.offsets[name] or {}
+        emails = list(old_offsets) + [email for email in data if email not in old_offsets]
+        offsets = {}
+        with open(filename + ".tmp", "wb") as f:
+            f.write(b"{")
+            for i, email in enumerate(emails):
+                if email in data:
+                    # Отступ как у json.dump(indent=4): внутри строк JSON переводов строки нет
+                    chunk = json.dumps(dump_tasks(data[email]), ensure_ascii=False, indent=4)
+                    chunk = chunk.replace("\n", "\n    ").encode("utf-8")
+                else:
+                    chunk = self._read_chunk(name, email)
+                f.write(b",\n    " if i else b"\n    ")
+                f.write(json.dumps(email, ensure_ascii=False).encode("utf-8") + b": ")
+                offsets[email] = [f.tell(), f.tell() + len(chunk)]
+                f.write(chunk)
+            f.write(b"\n}")
+            self._sync(f)
+        self._replace(filename + ".tmp", filename)
+        if name in self.handles:
+            self.handles.pop(name).close()
+        self.handles[name] = open(filename, "rb")
+        version = self.versions[filename] = file_version(filename, os.fstat(self.handles[name].fileno()))
+        self.offsets[name] = offsets
+        self.opened[name].update(data)
+        with open(filename + ".idx.tmp", "w", encoding="utf-8") as f:
+            json.dump({"version": version, "offsets": offsets}, f, ensure_ascii=False)
+        os.replace(filename + ".idx.tmp", filename + ".idx")
+
+    def _save_snapshot(self, name: str):
+        """Сохраняет двоичный снимок: неоткрытые разделы копируются из старого как есть"""
+        filename = self.files[name]
+        data = self.task_maps[name]
+        old_offsets = self.offsets[name] or {}
+        emails = list(old_offsets) + [email for email in data if email not in old_offsets]
+        with open(filename + ".tmp", "wb") as f:
+            write_snapshot(f, ((email, encode_tasks(dump_tasks(data[email])) if email in data
+                                else self._read_chunk(name, email)) for email in emails))
+            self._sync(f)
+        self._replace(filename + ".tmp", filename)
+        if name in self.handles:
+            self.handles.pop(name).close()
+        self.handles[name] = SnapshotReader(filename)
+        self.versions[filename] = file_version(filename, os.fstat(self.handles[name].fileno()))
+        self.offsets[name] = self.handles[name].sections
+        self.opened[name].update(data)
+
+    def refresh(self):
+        with self.lock:
+            if self.users_loaded and file_version(self.users_file) != self.versions.get(self.users_file):
+                self.users[:] = load_users(self._load_data(self.users_file, default=[]))
+                self._notify(set(), None)
+            for name, filename in self.files.items():
+                if file_version(filename) != self.versions.get(filename):
+                    self._open_file(name)
+                    self._notify(None, [])
+
+    def _changed(self, *names: str):
+        self.dirty.update(names)
+        if self.batch_depth:
+            return
+        if not self.flush_interval:
+            self.flush()
+            return
+        # Изменения делаются внутри write(), то есть под process_lock
+        self.process_lock.kept = True
+        if self.writer is None:
+            self.writer = threading.Thread(target=self._writer, daemon=True)
+            self.writer.start()
+            atexit.register(self.close)
+        self.flush_requested.set()
+
+    def _writer(self):
+        while True:
+            self.flush_requested.wait()
+            # Изменения, сделанные за flush_interval, сохранятся вместе
+            time.sleep(self.flush_interval)
+            self.flush_requested.clear()
+            try:
+                self.close()
+            except Exception:
+                # close уже отпустил process_lock, а несохранённое вернул в dirty:
+                # попробуем снова через flush_interval
+                logger.exception("Не удалось сохранить отложенные изменения")
+                self.flush_requested.set()
+
+    def close(self):
+        """Сохраняет отложенные изменения и отпускает process_lock для других процессов"""
+        with self.process_lock:
+            self.process_lock.kept = False
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            dirty, self.dirty = self.dirty, set()
+            try:
+                if "users" in dirty:
+                    self._save_data(dump_users(self.users), self.users_file)
+                    dirty.discard("users")
+                for name in self.files:
+                    if name in dirty:
+                        self._save_file(name)
+                        dirty.discard(name)
+            finally:
+                # Если сохранение прервалось, несохранённое сохранится в следующий раз
+                self.dirty |= dirty
+
+    def add_user(self, user: User):
+        self._changed("users")
+
+    def ensure_user(self, email: str):
+        self._changed("tasks")
+
+    def add_task(self, email: str, task: Task):
+        self._changed("tasks")
+
+    def update_task(self, email: str, task: Task):
+        self._changed("tasks")
+
+    def delete_task(self, email: str, task: Task):
+        self._changed("tasks", "trash")
+
+    def restore_task(self, email: str, task: Task):
+        self._changed("tasks", "trash")
+
+    def empty_trash(self, email: str):
+        self._changed("trash")
+
+    def purge_tasks(self, email: str, tasks: List[Task]):
+        self._changed("trash")
+
+
+class JournaledJsonStorage(JsonStorage):
+    """JSON-файлы остаются основным хранилищем, но изменения дописываются
+    в журнал (одна JSON-строка на операцию) вместо перезаписи файлов.
+
+    Фоновый поток сворачивает журнал в снимки, когда тот превышает
+    compact_threshold байт. При запуске читаются снимки и поверх них
+    проигрывается журнал.
+
+    Сворачивание:
+      1. журнал переименовывается в <journal>.old, новые записи идут в свежий файл;
+      2. снимки с диска + <journal>.old собираются в новые снимки (*.tmp);
+      3. в <journal>.state записывается номер последней свёрнутой записи
+         и список *.tmp, ожидающих переименования;
+      4. *.tmp переименовываются поверх снимков, <journal>.old удаляется.
+    Если процесс упал после шага 3, переименования завершаются при запуске,
+    а записи с номером не больше snapshot_seq не проигрываются повторно.
+
+    Журнал общий для всех процессов: записи дописываются под process_lock,
+    а чужие записи дочитываются с запомненного смещения, без перечитывания
+    снимков. Шаги 1 и 3–4 тоже выполняются под process_lock.
+    """
+
+    def __init__(self, users_file: str, tasks_file: str, trash_file: str, journal_file: str,
+                 compact_threshold: int = 1024 * 1024, fsync: bool = False):
+        super().__init__(users_file, tasks_file, trash_file)
+        self.process_lock = ProcessLock(journal_file + ".lock")
+        self.compact_lock = ProcessLock(journal_file + ".compact.lock")
+        self.journal_file = journal_file
+        self.old_journal_file = journal_file + ".old"
+        self.state_file = journal_file + ".state"
+        self.compact_threshold = compact_threshold
+        self.fsync = fsync
+        self.compact_requested = threading.Event()
+        self.pending: List[str] = []
+
+    # Файлы не перезаписываются при каждом изменении, поэтому блокировки — по пользователям.
+    # Журнал проигрывается поверх всех данных сразу, поэтому они читаются при запуске
+    user_lock = Storage.user_lock
+    _open_user = Storage._open_user
+    _peek_user = Storage._peek_user
+
+    def _load_data(self, filename: str, default):
+        # Снимки пишутся атомарно, поэтому испорченный файл — это ошибка,
+        # а не повод молча начать с пустых данных
+        try:
+            with open(filename, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return default
+
+    def _save_data(self, data, filename: str):
+        self._write_file(filename + ".tmp", json.dumps(data, ensure_ascii=False, indent=4))
+        os.replace(filename + ".tmp", filename)
+
+    def _load_snapshots(self):
+        users = load_users(self._load_data(self.users_file, default=[]))
+        tasks = index_tasks(self._load_data(self.tasks_file, default={}))[0]
+        trash = index_tasks(self._load_data(self.trash_file, default={}))[0]
+        return users, tasks, trash
+
+    def _read_state(self) -> Dict:
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"snapshot_seq": 0, "pending": []}
+
+    def _write_state(self, state: Dict):
+        self._write_file(self.state_file + ".tmp", json.dumps(state))
+        os.replace(self.state_file + ".tmp", self.state_file)
+
+    def _write_file(self, filename: str, content: str):
+        with open(filename, "w", encoding="utf-8") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _finish_pending(self, state: Dict):
+        for filename in state["pending"]:
+            if os.path.exists(filename + ".tmp"):
+                os.replace(filename + ".tmp", filename)
+        if state["pending"]:
+            state["pending"] = []
+            self._write_state(state)
+
+    def _inode(self, filename: str) -> Optional[int]:
+        try:
+            return os.stat(filename).st_ino
+        except FileNotFoundError:
+            return None
+
+    def load(self):
+        with self.process_lock:
+            state = self._read_state()
+            self._finish_pending(state)
+            self.users = load_users(self._load_data(self.users_file, default=[]))
+            self.tasks, tasks_changed = index_tasks(self._load_data(self.tasks_file, default={}))
+            self.trash, trash_changed = index_tasks(self._load_data(self.trash_file, default={}))
+            # Присвоенные при загрузке id сразу сохраняются, чтобы не меняться между запусками
+            if tasks_changed:
+                self._save_data(unindex_tasks(self.tasks), self.tasks_file)
+            if trash_changed:
+                self._save_data(unindex_tasks(self.trash), self.trash_file)
+            self.seq = state["snapshot_seq"]
+            data = (self.users, self.tasks, self.trash)
+            for filename in (self.old_journal_file, self.journal_file):
+                self.seq = max(self.seq, self._replay(filename, data, state["snapshot_seq"], repair=True)[0])
+            self._open_journal()
+        threading.Thread(target=self._compactor, daemon=True).start()
+        return data
+
+    def _open_journal(self):
+        self.journal = open(self.journal_file, "ab")
+        self.journal_ino = os.fstat(self.journal.fileno()).st_ino
+        self.journal_offset = self.journal.tell()
+
+    def _replay(self, filename: str, data, after_seq: int, repair: bool = False) -> Tuple[int, int]:
+        """Применяет к data записи журнала с номером больше after_seq.
+
+        Возвращает последний номер и смещение конца последней целой записи.
+        С repair=True недописанная при падении запись отрезается.
+        """
+        last_seq = after_seq
+        try:
+            f = open(filename, "rb+")
+        except FileNotFoundError:
+            return last_seq, 0
+        with f:
+            offset = 0
+            for line in iter(f.readline, b""):
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("unterminated record")
+                    record = json.loads(line)
+                except ValueError:
+                    if repair:
+                        # Недописанная при падении строка: отрезаем её, чтобы новые записи шли следом
+                        f.truncate(offset)
+                    break
+                offset += len(line)
+                if record["seq"] > after_seq:
+                    self._apply(record, data)
+                    last_seq = record["seq"]
+        return last_seq, offset
+
+    def _apply(self, record: Dict, data):
+        users, tasks, trash = data
+        op = record["op"]
+        email = record.get("email")
+        if op == "add_user":
+            users.append(User.from_dict(record["user"]))
+        elif op == "ensure_user":
+            tasks.setdefault(email, {})
+        elif op == "add_task":
+            task = Task.from_dict(record["task"])
+            if task.id is None:
+                task.id = new_task_id()
+            tasks.setdefault(email, {})[task.id] = task
+        elif op == "update_task":
+            task = self._find(tasks, email, record)
+            if task:
+                task.completed = record["completed"]
+        elif op == "delete_task":
+            task = self._find(tasks, email, record)
+            if task:
+                del tasks[email][task.id]
+                task.deleted = parse_created(record.get("deleted_at"))
+                trash.setdefault(email, {})[task.id] = task
+        elif op == "restore_task":
+            task = self._find(trash, email, record)
+            if task:
+                del trash[email][task.id]
+                task.deleted = None
+                tasks.setdefault(email, {})[task.id] = task
+        elif op == "empty_trash":
+            trash[email] = {}
+        elif op == "purge_tasks":
+            user_trash = trash.get(email, {})
+            for task_id in record["ids"]:
+                user_trash.pop(task_id, None)
+
+    def _find(self, source: Dict, email: str, record: Dict):
+        if "id" in record:
+            return source.get(email, {}).get(record["id"])
+        # Записи журнала, сделанные до появления id, ссылаются на задачу по тексту
+        for task in source.get(email, {}).values():
+            if task.text == record["text"]:
+                return task
+        return None
+
+    def refresh(self):
+        if self._inode(self.journal_file) == self.journal_ino:
+            self._tail(self.journal_file)
+            return
+        # Журнал свёрнут другим процессом. Переход на новый файл — под process_lock,
+        # пока журналы и снимки никто не трогает
+        if not self.process_lock.held():
+            return True
+        old_ino = self._inode(self.old_journal_file)
+        if old_ino == self.journal_ino:
+            # Наш журнал ещё лежит в <journal>.old: дочитываем его
+            self._tail(self.old_journal_file)
+        elif old_ino is not None or self.seq < self._read_state()["snapshot_seq"]:
+            # Часть непрочитанных записей уже только в снимках
+            self._reload()
+            return
+        with self.lock:
+            self.journal.close()
+            self._open_journal()
+            self.journal_offset = 0
+        self._tail(self.journal_file)
+
+    def _tail(self, filename: str):
+        """Применяет записи других процессов, дописанные после journal_offset"""
+        with self.lock:
+            start = self.journal_offset
+        try:
+            f = open(filename, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            # Между проверкой и открытием журнал могли свернуть — тогда это уже другой файл
+            if os.fstat(f.fileno()).st_ino != self.journal_ino:
+                return
+            f.seek(start)
+            chunk = f.read()
+        # Последняя строка может быть ещё не дописана — её прочитаем в следующий раз
+        end = chunk.rfind(b"\n") + 1
+        data = (self.users, self.tasks, self.trash)
+        for line in chunk[:end].splitlines():
+            record = json.loads(line)
+            if record["seq"] <= self.seq:
+                continue  # своя запись
+            email = record.get("email")
+            with self.user_lock(email if record["op"] != "add_user" else None):
+                self._apply(record, data)
+                if record["op"] == "add_user":
+                    self._notify(set(), self.users[-1:])
+                else:
+                    self._notify({email}, [])
+            self.seq = record["seq"]
+        with self.lock:
+            # Пока мы читали, flush мог уже сдвинуть смещение за свои записи
+            self.journal_offset = max(self.journal_offset, start + end)
+
+    def _reload(self):
+        """Перечитывает снимки и журналы целиком; вызывается под process_lock"""
+        state = self._read_state()
+        self._finish_pending(state)
+        users, tasks, trash = data = self._load_snapshots()
+        seq = state["snapshot_seq"]
+        offset = 0
+        for filename in (self.old_journal_file, self.journal_file):
+            last_seq, offset = self._replay(filename, data, state["snapshot_seq"])
+            seq = max(seq, last_seq)
+        with self.user_lock(None):
+            self.users[:] = users
+            self._notify(set(), None)
+        for email in set(self.tasks) | set(tasks) | set(self.trash) | set(trash):
+            with self.user_lock(email):
+                for live, loaded in ((self.tasks, tasks), (self.trash, trash)):
+                    if email in loaded:
+                        live[email] = loaded[email]
+                    else:
+                        live.pop(email, None)
+                self._notify({email}, [])
+        with self.lock:
+            self.journal.close()
+            self._open_journal()
+            self.journal_offset = offset
+            self.seq = seq
+
+    def _append(self, record: Dict):
+        with self.lock:
+            self.seq += 1
+            record["seq"] = self.seq
+            self.pending.append(json.dumps(record, ensure_ascii=False) + "\n")
+        if not self.batch_depth:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return
+            # Всё, что дальше прочитанного, — недописанная запись упавшего процесса:
+            # записи других живых процессов уже дочитаны под process_lock
+            if os.fstat(self.journal.fileno()).st_size > self.journal_offset:
+                self.journal.truncate(self.journal_offset)
+            self.journal.write("".join(self.pending).encode("utf-8"))
+            self.pending = []
+            self.journal.flush()
+            if self.fsync:
+                os.fsync(self.journal.fileno())
+            self.journal_offset = self.journal.tell()
+            if self.journal_offset > self.compact_threshold:
+                self.compact_requested.set()
+
+    def add_user(self, user: User):
+        self._append({"op": "add_user", "user": user.to_dict()})
+
+    def ensure_user(self, email: str):
+        self._append({"op": "ensure_user", "email": email})
+
+    def add_task(self, email: str, task: Task):
+        self._append({"op": "add_task", "email": email, "task": task.to_dict()})
+
+    def update_task(self, email: str, task: Task):
+        self._append({"op": "update_task", "email": email, "id": task.id, "completed": task.completed})
+
+    def delete_task(self, email: str, task: Task):
+        self._append({"op": "delete_task", "email": email, "id": task.id, "deleted_at": task.deleted_at})
+
+    def restore_task(self, email: str, task: Task):
+        self._append({"op": "restore_task", "email": email, "id": task.id})
+
+    def empty_trash(self, email: str):
+        self._append({"op": "empty_trash", "email": email})
+
+    def purge_tasks(self, email: str, tasks: List[Task]):
+        self._append({"op": "purge_tasks", "email": email, "ids": [task.id for task in tasks]})
+
+    def _compactor(self):
+        while True:
+            self.compact_requested.wait()
+            self.compact_requested.clear()
+            try:
+                self.compact()
+            except Exception:
+                # Журнал свернётся при следующем запросе: записи в нём не теряются
+                logger.exception("Не удалось свернуть журнал")
+
+    def _rotate_journal(self):
+        with self.process_lock:
+            # Сначала дочитываем записи других процессов: после переименования
+            # этот процесс будет читать только новый журнал
+            with self.refresh_lock:
+                self.refresh()
+            self._finish_pending(self._read_state())
+            with self.lock:
+                self.journal.close()
+                if os.path.exists(self.old_journal_file):
+                    # Предыдущее сворачивание не завершилось: дописываем журнал к старому
+                    with open(self.journal_file, "rb") as src, open(self.old_journal_file, "ab") as dst:
+                        dst.write(src.read())
+                    os.remove(self.journal_file)
+                else:
+                    os.replace(self.journal_file, self.old_journal_file)
+                self._open_journal()
+
+    def compact(self):
+        """Сворачивает журнал в снимки. Работает с копией данных с диска, а не с данными в памяти."""
+        with self.compact_lock:
+            self._rotate_journal()
+            state = self._read_state()
+            users, tasks, trash = data = self._load_snapshots()
+            snapshot_seq = self._replay(self.old_journal_file, data, state["snapshot_seq"])[0]
+            files = [self.users_file, self.tasks_file, self.trash_file]
+            for filename, content in zip(files, (dump_users(users), unindex_tasks(tasks), unindex_tasks(trash))):
+                self._write_file(filename + ".tmp", json.dumps(content, ensure_ascii=False, indent=4))
+            with self.process_lock:
+                state = {"snapshot_seq": snapshot_seq, "pending": files}
+                self._write_state(state)
+                self._finish_pending(state)
+                os.remove(self.old_journal_file)
+
+    def close(self):
+        with self.process_lock:
+            self.flush()
+        self.compact()
+        with self.lock:
+            self.journal.close()
+
+
+class ShardedJsonStorage(Storage):
+    """Задачи и корзина каждого пользователя — в отдельном JSON-файле.
+
+    Файл пользователя: <shards_dir>/<xx>/<sha1(email)>.json, где xx — первые
+    два символа хеша. Изменение задач перезаписывает только файл этого
+    пользователя. Файл читается при первом обращении к задачам
+    пользователя; в памяти остаются не больше max_loaded_users недавно
+    активных пользователей, остальные вытесняются.
+
+    Между процессами запись сериализуется блокировкой группы xx, а не
+    всего хранилища; перед обращением к задачам версия файла сверяется
+    с прочитанной. Список пользователей остаётся одним файлом.
+    """
+
+    def __init__(self, users_file: str, shards_dir: str, max_loaded_users: int = 1000,
+                 tasks_file: str = None, trash_file: str = None):
+        super().__init__(ProcessLock(os.path.join(shards_dir, "batch.lock")))
+        self.users_file = users_file
+        self.shards_dir = shards_dir
+        self.max_loaded_users = max_loaded_users
+        # Общие файлы прежнего формата: при первом запуске задачи переносятся из них
+        self.tasks_file = tasks_file
+        self.trash_file = trash_file
+        self.lock = threading.RLock()
+        self.users_version = None
+        self.users_loaded = False
+        self.loaded: "OrderedDict[str, object]" = OrderedDict()  # email -> версия файла, по давности обращения
+        self.unsaved: Set[Optional[str]] = set()
+        self.group_locks: Dict[str, ProcessLock] = {}
+
+    def _shard_path(self, email: str) -> str:
+        digest = hashlib.sha1(email.encode("utf-8")).hexdigest()
+        return os.path.join(self.shards_dir, digest[:2], digest + ".json")
+
+    def _group_lock(self, email: Optional[str]) -> ProcessLock:
+        group = "users" if email is None else hashlib.sha1(email.encode("utf-8")).hexdigest()[:2]
+        with self.lock:
+            lock = self.group_locks.get(group)
+            if lock is None:
+                lock = self.group_locks[group] = ProcessLock(os.path.join(self.shards_dir, group + ".lock"))
+        return lock
+
+    @contextmanager
+    def write(self, email: Optional[str]):
+        lock = self._group_lock(email)
+        with lock:
+            if self.batch_depth and lock not in self.local.held:
+                # Внутри batch() блокировка держится до сохранения в flush()
+                lock.__enter__()
+                self.local.held.append(lock)
+            self._refresh()
+            with self.user_lock(email):
+                self._open_user(email)
+                yield
+
+    def load(self):
+        os.makedirs(self.shards_dir, exist_ok=True)
+        self.users, self.tasks, self.trash = [], {}, {}
+        with self._group_lock(None):
+            marker = os.path.join(self.shards_dir, "split")
+            if not os.path.exists(marker):
+                self._split_legacy_files()
+                open(marker, "w").close()
+        return self.users, self.tasks, self.trash
+
+    def _split_legacy_files(self):
+        """Раскладывает задачи из общих файлов по файлам пользователей"""
+        legacy = {}
+        for name, filename in (("tasks", self.tasks_file), ("trash", self.trash_file)):
+            if filename is None:
+                continue
+            try:
+                with open(filename, "r", encoding="utf-8") as f:
+                    data = index_tasks(json.load(f))[0]
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue
+            for email, tasks in data.items():
+                legacy.setdefault(email, {"tasks": {}, "trash": {}})[name] = tasks
+        for email, shard in legacy.items():
+            self._save_shard(email, shard["tasks"], shard["trash"])
+
+    def _load_users(self):
+        try:
+            with open(self.users_file, "r", encoding="utf-8") as f:
+                self.users_version = file_version(self.users_file, os.fstat(f.fileno()))
+                self.users[:] = load_users(json.load(f))
+        except FileNotFoundError:
+            self.users_version = None
+            self.users[:] = []
+        self.users_loaded = True
+        self._notify(set(), None)
+
+    def refresh(self):
+        if self.users_loaded and file_version(self.users_file) != self.users_version:
+            with self.user_lock(None):
+                self._load_users()
+
+    def _open_user(self, email: Optional[str]):
+        if email is None:
+            # Список пользователей читается при первом обращении к нему
+            if not self.users_loaded:
+                self._load_users()
+            return
+        path = self._shard_path(email)
+        version = file_version(path)
+        with self.lock:
+            fresh = email in self.loaded and self.loaded[email] == version
+            if email in self.loaded:
+                self.loaded.move_to_end(email)
+        if not fresh:
+            # Файл ещё не читался или его перезаписал другой процесс
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    version = file_version(path, os.fstat(f.fileno()))
+                    shard = json.load(f)
+                self.tasks[email] = {task.id: task for task in map(Task.from_dict, shard["tasks"])}
+                self.trash[email] = {task.id: task for task in map(Task.from_dict, shard["trash"])}
+            except FileNotFoundError:
+                self.tasks.pop(email, None)
+                self.trash.pop(email, None)
+            with self.lock:
+                self.loaded[email] = version
+            self._notify({email}, [])
+        self._evict(email)
+
+    def _peek_user(self, email: str):
+        with self.lock:
+            loaded = email in self.loaded
+        if loaded:
+            return super()._peek_user(email)
+        try:
+            with open(self._shard_path(email), "r", encoding="utf-8") as f:
+                shard = json.load(f)
+        except FileNotFoundError:
+            return [], []
+        return list(map(Task.from_dict, shard["tasks"])), list(map(Task.from_dict, shard["trash"]))
+
+    def _evict(self, keep: str):
+        """Выгружает давно не использовавшихся пользователей сверх max_loaded_users"""
+        with self.lock:
+            excess = len(self.loaded) - self.max_loaded_users
+            candidates = [email for email in islice(self.loaded, max(excess, 0) * 2)
+                          if email != keep and email not in self.unsaved]
+        for email in candidates[:excess]:
+            lock = self.user_lock(email)
+            # Пользователь, с которым сейчас работает другой поток, остаётся в памяти
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                with self.lock:
+                    if email in self.unsaved or email not in self.loaded:
+                        continue
+                    del self.loaded[email]
+                self.tasks.pop(email, None)
+                self.trash.pop(email, None)
+                self._notify({email}, [])
+            finally:
+                lock.release()
+
+    def _save_shard(self, email: str, tasks: Dict[str, Task], trash: Dict[str, Task]):
+        path = self._shard_path(email)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"email": email, "tasks": dump_tasks(tasks), "trash": dump_tasks(trash)},
+                      f, ensure_ascii=False, indent=4)
+        os.replace(path + ".tmp", path)
+        return file_version(path)
+
+    def _changed(self, email: Optional[str]):
+        self.local.dirty.add(email)
+        with self.lock:
+            self.unsaved.add(email)
+        if not self.batch_depth:
+            self.flush()
+
+    def flush(self):
+        dirty, self.local.dirty = self.local.dirty, set()
+        for email in dirty:
+            if email is None:
+                with open(self.users_file + ".tmp", "w", encoding="utf-8") as f:
+                    json.dump(dump_users(self.users), f, ensure_ascii=False, indent=4)
+                os.replace(self.users_file + ".tmp", self.users_file)
+                self.users_version = file_version(self.users_file)
+                continue
+            version = self._save_shard(email, self.tasks.get(email, {}), self.trash.get(email, {}))
+            with self.lock:
+                if email in self.loaded:
+                    self.loaded[email] = version
+        with self.lock:
+            self.unsaved -= dirty
+        held, self.local.held = self.local.held, []
+        for lock in held:
+            lock.__exit__(None, None, None)
+
+    def add_user(self, user: User):
+        self._changed(None)
+
+    def ensure_user(self, email: str):
+        self._changed(email)
+
+    def add_task(self, email: str, task: Task):
+        self._changed(email)
+
+    def update_task(self, email: str, task: Task):
+        self._changed(email)
+
+    def delete_task(self, email: str, task: Task):
+        self._changed(email)
+
+    def restore_task(self, email: str, task: Task):
+        self._changed(email)
+
+    def empty_trash(self, email: str):
+        self._changed(email)
+
+    def purge_tasks(self, email: str, tasks: List[Task]):
+        self._changed(email)
+
+
+class SqliteTransaction:
+    """Транзакция записи текущего потока; вложенный вход новую не начинает.
+
+    BEGIN IMMEDIATE сразу берёт блокировку записи базы, поэтому
+    транзакция служит и блокировкой между процессами.
+    """
+
+    def __init__(self, storage: "SqliteStorage"):
+        self.storage = storage
+        self.local = threading.local()
+
+    def held(self) -> bool:
+        return getattr(self.local, "depth", 0) > 0
+
+    def __enter__(self):
+        depth = getattr(self.local, "depth", 0)
+        if depth == 0:
+            self.storage.conn.execute("BEGIN IMMEDIATE")
+        self.local.depth = depth + 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.local.depth -= 1
+        if self.local.depth == 0:
+            # Исключение в блоке записи — изменения не сохраняются наполовину
+            self.storage.conn.execute("COMMIT" if exc_type is None else "ROLLBACK")
+
+
+class SqliteStorage(Storage):
+    """Хранение во встроенной базе SQLite в режиме WAL.
+
+    Задачи и корзина лежат в одной таблице: задача в корзине помечена
+    in_trash = 1. Порядок задач задаёт столбец seq, поэтому удаление и
+    восстановление — это обновление одной строки по уникальному индексу
+    (email, id), а не перенос между таблицами. id уникален только в пределах
+    пользователя: при импорте у разных пользователей могут оказаться задачи
+    с одним id.
+
+    Каждое изменение получает следующий общий номер версии, он же seq
+    задачи; в user_versions хранится последняя версия каждого пользователя.
+    Процесс помнит последнюю виденную версию и перечитывает только
+    пользователей с версией больше неё.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            email TEXT PRIMARY KEY,
+            phone TEXT NOT NULL UNIQUE,
+            name TEXT NOT NULL,
+            password TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS tasks (
+            id TEXT,
+            email TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            in_trash INTEGER NOT NULL DEFAULT 0,
+            text TEXT NOT NULL,
+            completed INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT,
+            due_date TEXT,
+            deleted_at TEXT
+        );
+        CREATE TABLE IF NOT EXISTS user_versions (
+            email TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        );
+    """
+
+    INDEXES = """
+        DROP INDEX IF EXISTS tasks_by_text;
+        DROP INDEX IF EXISTS tasks_by_id;
+        CREATE UNIQUE INDEX IF NOT EXISTS tasks_by_email_id ON tasks (email, id);
+        CREATE INDEX IF NOT EXISTS tasks_by_seq ON tasks (email, in_trash, seq);
+        CREATE INDEX IF NOT EXISTS user_versions_by_version ON user_versions (version);
+    """
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self.connections = threading.local()
+        super().__init__(SqliteTransaction(self))
+        self.conn.executescript(self.SCHEMA)
+        self._add_task_ids()
+        self._add_deleted_at()
+        self.conn.executescript(self.INDEXES)
+        # Строка '' хранит начальную версию: новые версии больше seq уже существующих задач
+        self.conn.execute("INSERT OR IGNORE INTO user_versions (email, version) "
+                          "SELECT '', COALESCE(MAX(seq), 0) FROM tasks")
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """Своё соединение у каждого потока (и у процесса после fork)"""
+        if getattr(self.connections, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.db_file, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.connections.conn = conn
+            self.connections.pid = os.getpid()
+        return self.connections.conn
+
+    def _add_task_ids(self):
+        """Добавляет столбец id в базы, созданные до его появления"""
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(tasks)")]
+        if "id" in columns:
+            return
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("ALTER TABLE tasks ADD COLUMN id TEXT")
+            rowids = [row[0] for row in self.conn.execute("SELECT rowid FROM tasks")]
+            self.conn.executemany("UPDATE tasks SET id = ? WHERE rowid = ?",
+                                  [(new_task_id(), rowid) for rowid in rowids])
+
+    def _add_deleted_at(self):
+        """Добавляет столбец deleted_at в базы, созданные до его появления"""
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(tasks)")]
+        if "deleted_at" not in columns:
+            self.conn.execute("ALTER TABLE tasks ADD COLUMN deleted_at TEXT")
+
+    def _next_version(self, email: str) -> int:
+        """Новая версия пользователя; вызывается внутри транзакции записи"""
+        version = self.conn.execute("SELECT MAX(version) + 1 FROM user_versions").fetchone()[0]
+        self.conn.execute("INSERT OR REPLACE INTO user_versions (email, version) VALUES (?, ?)", (email, version))
+        self.seen_version = max(self.seen_version, version)
+        return version
+
+    def _users_after(self, rowid: int) -> List[Tuple[int, User]]:
+        return [
+            (rowid, User(name, email, phone, password))
+            for rowid, email, phone, name, password in self.conn.execute(
+                "SELECT rowid, email, phone, name, password FROM users WHERE rowid > ? ORDER BY rowid", (rowid,))
+        ]
+
+    def _tasks_where(self, where: str, args=()):
+        rows = self.conn.execute(
+            "SELECT id, email, in_trash, text, completed, created_at, due_date, deleted_at FROM tasks " + where,
+            args)
+        for task_id, email, in_trash, text, completed, created_at, due_date, deleted_at in rows:
+            yield email, in_trash, Task.from_dict({
+                "id": task_id,
+                "text": text,
+                "completed": bool(completed),
+                "created_at": created_at,
+                "due_date": due_date,
+                "deleted_at": deleted_at
+            })
+
+    def load(self):
+        # Пользователи и задачи читаются при первом обращении к ним
+        self.users, self.tasks, self.trash = [], {}, {}
+        self.users_loaded = False
+        self.opened: Set[str] = set()
+        self.last_user_rowid = 0
+        self.seen_version = self.conn.execute("SELECT MAX(version) FROM user_versions").fetchone()[0]
+        return self.users, self.tasks, self.trash
+
+    def _open_user(self, email: Optional[str]):
+        if email is None:
+            if not self.users_loaded:
+                self._add_new_users()
+                self.users_loaded = True
+            return
+        if email not in self.opened:
+            self._reload_user(email)
+            self.opened.add(email)
+
+    def _add_new_users(self):
+        rows = self._users_after(self.last_user_rowid)
+        if rows:
+            new_users = [user for _, user in rows]
+            self.users.extend(new_users)
+            self.last_user_rowid = rows[-1][0]
+            self._notify(set(), new_users)
+
+    def refresh(self):
+        if self.users_loaded:
+            with self.user_lock(None):
+                self._add_new_users()
+        changed = self.conn.execute(
+            "SELECT email, version FROM user_versions WHERE version > ? ORDER BY version",
+            (self.seen_version,)).fetchall()
+        for email, version in changed:
+            # Кого ещё не читали, прочитаем сразу в новом виде
+            if email in self.opened:
+                self._reload_user(email)
+            self.seen_version = max(self.seen_version, version)
+
+    def _peek_user(self, email: str):
+        if email in self.opened:
+            return super()._peek_user(email)
+        tasks, trash = [], []
+        for _, in_trash, task in self._tasks_where("WHERE email = ? ORDER BY in_trash, seq", (email,)):
+            (trash if in_trash else tasks).append(task)
+        return tasks, trash
+
+    def _reload_user(self, email: str):
+        tasks, trash = {}, {}
+        for _, in_trash, task in self._tasks_where("WHERE email = ? ORDER BY in_trash, seq", (email,)):
+            (trash if in_trash else tasks)[task.id] = task
+        with self.user_lock(email):
+            self.tasks[email] = tasks
+            self.trash[email] = trash
+            self._notify({email}, [])
+
+    def add_user(self, user: User):
+        cursor = self.conn.execute(
+            "INSERT INTO users (email, phone, name, password) VALUES (?, ?, ?, ?)",
+            (user.email, user.phone, user.name, user.password))
+        self.last_user_rowid = cursor.lastrowid
+
+    def ensure_user(self, email: str):
+        pass
+
+    def add_task(self, email: str, task: Task):
+        self.conn.execute(
+            "INSERT INTO tasks (id, email, seq, text, completed, created_at, due_date) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (task.id, email, self._next_version(email), task.text, int(task.completed),
+             task.created_at, task.due_date))
+
+    def update_task(self, email: str, task: Task):
+        self._next_version(email)
+        self.conn.execute("UPDATE tasks SET completed = ? WHERE email = ? AND id = ?",
+                          (int(task.completed), email, task.id))
+
+    def delete_task(self, email: str, task: Task):
+        self.conn.execute("UPDATE tasks SET in_trash = 1, seq = ?, deleted_at = ? WHERE email = ? AND id = ?",
+                          (self._next_version(email), task.deleted_at, email, task.id))
+
+    def restore_task(self, email: str, task: Task):
+        self.conn.execute("UPDATE tasks SET in_trash = 0, seq = ?, deleted_at = NULL WHERE email = ? AND id = ?",
+                          (self._next_version(email), email, task.id))
+
+    def empty_trash(self, email: str):
+        self._next_version(email)
+        self.conn.execute("DELETE FROM tasks WHERE email = ? AND in_trash = 1", (email,))
+
+    def purge_tasks(self, email: str, tasks: List[Task]):
+        self._next_version(email)
+        self.conn.executemany("DELETE FROM tasks WHERE email = ? AND id = ? AND in_trash = 1",
+                              [(email, task.id) for task in tasks])
+
+
+def migrate_json_to_sqlite(users_file: str, tasks_file: str, trash_file: str, db_file: str) -> int:
+    """Однократный перенос данных из JSON-файлов в SQLite. Возвращает число перенесённых задач."""
+    source = JsonStorage(users_file, tasks_file, trash_file)
+    users, tasks, trash = source.load()
+    source.open_all()
+    target = SqliteStorage(db_file)
+    target.load()
+    count = 0
+    with target.process_lock:
+        for user in users:
+            target.add_user(user)
+        # Сначала корзина, затем задачи: так порядок seq совпадает с порядком в файлах
+        for in_trash, source in ((1, trash), (0, tasks)):
+            for email, user_tasks in source.items():
+                for task in user_tasks.values():
+                    target.conn.execute(
+                        "INSERT INTO tasks (id, email, seq, in_trash, text, completed, created_at, due_date, "
+                        "deleted_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (task.id, email, target._next_version(email), in_trash, task.text,
+                         int(task.completed), task.created_at, task.due_date, task.deleted_at))
+                    count += 1
+    target.conn.close()
+    return count
+
+
+if __name__ == "__main__":
+    # python storage.py users.json users_tasks.json users_trash.json users.db
+    args = sys.argv[1:] or ["users.json", "users_tasks.json", "users_trash.json", "users.db"]
+    if os.path.exists(args[3]):
+        print(f"Файл {args[3]} уже существует, перенос отменён.")
+        sys.exit(1)
+    migrated = migrate_json_to_sqlite(*args)
+    print(f"✅ Перенесено задач: {migrated}")
@@ -0,0 +1,214 @@
+"""Нагрузочный тест: многопоточный dev-сервер Flask против асинхронного режима (asgi.py).
+
+Каждая сессия входит через /api/v1/login, а потом долго простаивает:
+между запросами она ждёт в среднем --think секунд, после чего читает
+список задач, а каждым пятым запросом отмечает задачу. Так видно, сколько
+одновременных малоактивных сессий выдерживает один процесс.
+
+Асинхронный режим запускается через uvicorn; если он не установлен,
+замеряется только Flask.
+
+Запуск: python benchmarks/asgi_load_test.py [--sessions 1000] [--duration 20] [--think 1.0] [flask asgi]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from importlib.util import find_spec
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+
+USERS = 100
+TASKS_PER_USER = 20
+
+
+def make_data(directory: str):
+    users = [{"name": f"Пользователь {u}", "email": f"user{u}@example.com", "phone": f"8{u:010d}",
+              "password": "secret"} for u in range(USERS)]
+    tasks = {user["email"]: [{"id": f"{u:06x}{t:06x}", "text": f"Задача {t}", "completed": False,
+                              "created_at": "2024-01-01 12:00:00", "due_date": None}
+                             for t in range(TASKS_PER_USER)]
+             for u, user in enumerate(users)}
+    for filename, data in (("users.json", users), ("users_tasks.json", tasks), ("users_trash.json", {})):
+        with open(os.path.join(directory, filename), "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+
+def serve_flask(port: int):
+    """Как app.run(threaded=True): поток на соединение, HTTP/1.0"""
+    import logging
+    import app
+    from werkzeug.serving import make_server
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)  # без строки журнала на каждый запрос
+    make_server("127.0.0.1", port, app.app, threaded=True).serve_forever()
+
+
+def start_server(mode: str, port: int, directory: str) -> subprocess.Popen:
+    if mode == "flask":
+        command = [sys.executable, os.path.abspath(__file__), "--serve-flask", str(port)]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "asgi:application", "--app-dir", APP_DIR,
+                   "--port", str(port), "--log-level", "warning", "--backlog", "4096"]
+    server = subprocess.Popen(command, cwd=directory)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError(f"{mode}: сервер не запустился")
+
+
+class Connection:
+    """HTTP/1.1-соединение одной сессии; переоткрывается, если сервер его закрыл"""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.reader = self.writer = None
+        self.cookie = ""
+
+    async def request(self, method: str, path: str, data=None):
+        body = b"" if data is None else json.dumps(data).encode("utf-8")
+        head = (f"{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n" + (f"Cookie: {self.cookie}\r\n" if self.cookie else "") + "\r\n")
+        reused = self.writer is not None
+        if not reused:
+            self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.port)
+        self.writer.write(head.encode("latin-1") + body)
+        status_line = await self.reader.readline()
+        if not status_line and reused:
+            # Сервер закрыл простаивавшее соединение: как обычный клиент, повторяем по новому
+            self.close()
+            return await self.request(method, path, data)
+        if not status_line:
+            raise ConnectionError("соединение закрыто")
+        version, status = status_line.decode("latin-1").split(" ", 2)[:2]
+        headers = {}
+        while True:
+            line = (await self.reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, value = line.split(":", 1)
+            headers[name.lower()] = value.strip()
+        keep_alive = version != "HTTP/1.0" and headers.get("connection", "").lower() != "close"
+        if "content-length" in headers:
+            content = await self.reader.readexactly(int(headers["content-length"]))
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            content = await self.read_chunked()
+        else:
+            content = await self.reader.read()
+            keep_alive = False
+        if "set-cookie" in headers:
+            self.cookie = headers["set-cookie"].split(";", 1)[0]
+        if not keep_alive:
+            self.close()
+        return int(status), content
+
+    async def read_chunked(self) -> bytes:
+        chunks = []
+        while True:
+            size = int((await self.reader.readline()).split(b";", 1)[0], 16)
+            chunk = await self.reader.readexactly(size + 2)  # с \r\n после фрагмента
+            if not size:
+                return b"".join(chunks)
+            chunks.append(chunk[:-2])
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+async def session(number: int, port: int, args, stop_at: float, latencies: list, errors: list):
+    connection = Connection(port)
+    email = f"user{number % USERS}@example.com"
+    task_ids = [f"{number % USERS:06x}{t:06x}" for t in range(TASKS_PER_USER)]
+    rng = random.Random(number)
+    try:
+        await connection.request("POST", "/api/v1/login", {"email_or_phone": email, "password": "secret"})
+        i = 0
+        while True:
+            await asyncio.sleep(rng.expovariate(1 / args.think))
+            if time.perf_counter() >= stop_at:
+                break
+            i += 1
+            start = time.perf_counter()
+            try:
+                if i % 5:
+                    status, _ = await connection.request("GET", "/api/v1/tasks?limit=20")
+                else:
+                    status, _ = await connection.request("POST", f"/api/v1/tasks/{rng.choice(task_ids)}/toggle")
+            except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+                connection.close()
+                errors.append(type(e).__name__)
+                continue
+            if status != 200:
+                errors.append(str(status))
+            latencies.append(time.perf_counter() - start)
+    except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+        errors.append(type(e).__name__)
+    finally:
+        connection.close()
+
+
+async def load(port: int, args):
+    latencies, errors = [], []
+    stop_at = time.perf_counter() + args.duration
+    sessions = []
+    for number in range(args.sessions):
+        sessions.append(asyncio.create_task(session(number, port, args, stop_at, latencies, errors)))
+        if number % 100 == 99:
+            await asyncio.sleep(0.05)  # сессии подключаются не все в одну миллисекунду
+    await asyncio.gather(*sessions)
+    return latencies, errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modes", nargs="*", default=["flask", "asgi"])
+    parser.add_argument("--sessions", type=int, default=1000, help="одновременных сессий")
+    parser.add_argument("--duration", type=float, default=20, help="секунд нагрузки")
+    parser.add_argument("--think", type=float, default=1.0, help="среднее время простоя сессии, с")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--serve-flask", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_flask:
+        serve_flask(args.serve_flask)
+        sys.exit()
+
+    print(f"сессий: {args.sessions}, простой: {args.think} с, длительность: {args.duration} с")
+    print(f"{'режим':>6} {'запросов':>9} {'запр./с':>8} {'p50, мс':>8} {'p95, мс':>8} {'p99, мс':>8} {'ошибок':>7}")
+    for mode in args.modes:
+        if mode == "asgi" and find_spec("uvicorn") is None:
+            print(f"{mode:>6}  пропущен: нужен uvicorn (pip install uvicorn)")
+            continue
+        directory = tempfile.mkdtemp()
+        make_data(directory)
+        server = start_server(mode, args.port, directory)
+        try:
+            latencies, errors = asyncio.run(load(args.port, args))
+        finally:
+            server.terminate()
+            server.wait()
+            shutil.rmtree(directory, ignore_errors=True)
+        latencies.sort()
+
+        def percentile(p: float) -> float:
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0.0
+
+        print(f"{mode:>6} {len(latencies):>9} {len(latencies) / args.duration:>8.0f} {percentile(0.5):>8.1f} "
+              f"{percentile(0.95):>8.1f} {percentile(0.99):>8.1f} {len(errors):>7}")
+        if errors:
+            print(f"{'':>6} ошибки: {dict(Counter(errors))}")
@@ -0,0 +1,56 @@
+"""Замер времени входа в зависимости от числа зарегистрированных пользователей.
+
+Запуск: python benchmarks/login_benchmark.py [1000 10000 100000 1000000]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+# app.py при импорте создаёт UserManager над файлами в текущей папке
+os.chdir(tempfile.mkdtemp())
+
+from app import UserManager  # noqa: E402
+from records import User  # noqa: E402
+from storage import Storage  # noqa: E402
+
+
+class MemoryStorage(Storage):
+    """Хранилище без записи на диск: замеряется только сам вход"""
+
+    def __init__(self, users):
+        super().__init__()
+        self.users = users
+
+    def load(self):
+        return self.users, {}, {}
+
+    def ensure_user(self, email: str):
+        pass
+
+
+def make_users(count: int):
+    return [User(f"Пользователь {i}", f"user{i}@example.com", f"8{i:010d}", "secret") for i in range(count)]
+
+
+def bench_login(count: int, attempts: int = 10000) -> float:
+    """Среднее время одного входа в микросекундах"""
+    manager = UserManager(MemoryStorage(make_users(count)))
+    logins = []
+    for _ in range(attempts):
+        i = random.randrange(count)
+        logins.append(f"user{i}@example.com" if i % 2 else f"8{i:010d}")
+
+    start = time.perf_counter()
+    for login in logins:
+        assert manager.login_user(login, "secret") is not None
+    return (time.perf_counter() - start) / attempts * 1e6
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000, 1000000]
+    print(f"{'пользователей':>14} {'мкс на вход':>12}")
+    for size in sizes:
+        print(f"{size:>14} {bench_login(size):>12.2f}")
@@ -0,0 +1,56 @@
+"""Память на одну задачу и одного пользователя: словари из JSON против записей Task и User.
+
+Данные разбираются из JSON так же, как при загрузке файлов, и остаются
+в памяти; объём считается через tracemalloc.
+
+Запуск: python benchmarks/memory_benchmark.py [--tasks 200000]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from records import Task, User  # noqa: E402
+
+
+def make_json(tasks: int) -> tuple:
+    task_list = [{"id": f"{t:012x}", "text": f"Задача {t}", "completed": t % 3 == 0,
+                  "created_at": f"2024-01-{t % 28 + 1:02d} 12:{t % 60:02d}:{t % 59:02d}",
+                  "due_date": f"2024-02-{t % 28 + 1:02d}" if t % 2 else None}
+                 for t in range(tasks)]
+    user_list = [{"name": f"Пользователь {i}", "email": f"user{i}@example.com",
+                  "phone": f"8{i:010d}", "password": "secret"}
+                 for i in range(tasks)]
+    return json.dumps(task_list, ensure_ascii=False), json.dumps(user_list, ensure_ascii=False)
+
+
+def measure(build) -> int:
+    """Байт, которые занимает результат build()"""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=200000, help="число задач и пользователей")
+    args = parser.parse_args()
+
+    tasks_json, users_json = make_json(args.tasks)
+    rows = (
+        ("задача, dict", lambda: json.loads(tasks_json)),
+        ("задача, Task", lambda: [Task.from_dict(task) for task in json.loads(tasks_json)]),
+        ("пользователь, dict", lambda: json.loads(users_json)),
+        ("пользователь, User", lambda: [User.from_dict(user) for user in json.loads(users_json)]),
+    )
+    print(f"{'запись':>20} {'байт на запись':>15}")
+    for name, build in rows:
+        print(f"{name:>20} {measure(build) / args.tasks:>15.0f}")
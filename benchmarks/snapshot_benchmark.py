@@ -0,0 +1,86 @@
+"""Размер и скорость файла задач: JSON с indent=4 против двоичного снимка.
+
+Сравниваются полная запись и полное чтение файла в задачи (Task, как их
+читает хранилище), а также чтение задач одного пользователя: из JSON
+по индексу смещений, из снимка — через mmap по оглавлению.
+
+Запуск: python benchmarks/snapshot_benchmark.py [--users 10000] [--tasks 20]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from snapshot import SnapshotReader, decode_task_records, load_snapshot, save_snapshot  # noqa: E402
+from storage import JsonStorage, index_tasks  # noqa: E402
+
+
+def make_data(users: int, tasks: int) -> dict:
+    return {f"user{u}@example.com": [{"id": f"{u:06x}{t:06x}", "text": f"Задача {t}", "completed": t % 3 == 0,
+                                      "created_at": f"2024-01-{t % 28 + 1:02d} 12:{t % 60:02d}:00",
+                                      "due_date": "2024-02-01" if t % 2 else None}
+                                     for t in range(tasks)]
+            for u in range(users)}
+
+
+def timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    return (time.perf_counter() - start) * 1000
+
+
+def save_json(data: dict, filename: str):
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+
+
+def load_json(filename: str) -> dict:
+    with open(filename, "r", encoding="utf-8") as f:
+        return index_tasks(json.load(f))[0]
+
+
+def load_binary(filename: str) -> dict:
+    reader = SnapshotReader(filename)
+    try:
+        return {email: decode_task_records(reader.read(start, end)) for email, (start, end) in reader.sections.items()}
+    finally:
+        reader.close()
+
+
+def read_user(storage: JsonStorage, emails: list):
+    for email in emails:
+        storage.task_maps["tasks"].clear()
+        storage.opened["tasks"].clear()
+        storage._open_user(email)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--tasks", type=int, default=20, help="задач на пользователя")
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp())
+    data = make_data(args.users, args.tasks)
+    emails = [f"user{u}@example.com" for u in range(0, args.users, max(args.users // 100, 1))]
+    print(f"пользователей: {args.users}, задач: {args.users * args.tasks}")
+    print(f"{'формат':>8} {'размер, МБ':>11} {'запись, мс':>11} {'чтение, мс':>11} {'один польз., мс':>16}")
+    for name, save, load, binary in (("json", save_json, load_json, False),
+                                     ("binary", save_snapshot, load_binary, True)):
+        filename = "tasks.bin" if binary else "tasks.json"
+        write_ms = timed(lambda: save(data, filename))
+        read_ms = timed(lambda: load(filename))
+        if binary:
+            assert load_snapshot(filename) == data
+        else:
+            # Первая загрузка JSON сохраняет индекс смещений
+            JsonStorage("users.json", filename, "trash.json").load()
+        storage = JsonStorage("users.json", filename, "trash.json", binary=binary)
+        storage.load()
+        user_ms = timed(lambda: read_user(storage, emails)) / len(emails)
+        size = os.path.getsize(filename) / 2 ** 20
+        print(f"{name:>8} {size:>11.1f} {write_ms:>11.0f} {read_ms:>11.0f} {user_ms:>16.3f}")
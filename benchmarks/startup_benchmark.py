@@ -0,0 +1,77 @@
+"""Время запуска UserManager: прежняя полная загрузка JSON-файлов против ленивой.
+
+Полная загрузка разбирает users.json, users_tasks.json и users_trash.json
+целиком; ленивая только открывает файлы и читает индекс смещений, а данные
+пользователя разбирает при первом обращении к ним.
+
+Запуск: python benchmarks/startup_benchmark.py [--users 10000] [--tasks 20]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+# app.py при импорте создаёт UserManager над файлами в текущей папке
+os.chdir(tempfile.mkdtemp())
+
+from app import UserManager, DB_FILE, TASKS_FILE, TRASH_FILE  # noqa: E402
+from storage import JsonStorage, Storage, index_tasks, load_users  # noqa: E402
+
+
+class EagerJsonStorage(JsonStorage):
+    """Загрузка, как до ленивого чтения: все три файла разбираются при запуске"""
+
+    _open_user = Storage._open_user
+
+    def load(self):
+        self.users = load_users(self._load_data(self.users_file, default=[]))
+        self.tasks = index_tasks(self._load_data(self.tasks_file, default={}))[0]
+        self.trash = index_tasks(self._load_data(self.trash_file, default={}))[0]
+        return self.users, self.tasks, self.trash
+
+
+def make_files(users: int, tasks: int):
+    emails = [f"user{i}@example.com" for i in range(users)]
+    with open(DB_FILE, "w", encoding="utf-8") as f:
+        json.dump([{"name": f"Пользователь {i}", "email": email, "phone": f"8{i:010d}", "password": "secret"}
+                   for i, email in enumerate(emails)], f, ensure_ascii=False, indent=4)
+    for filename, count in ((TASKS_FILE, tasks), (TRASH_FILE, max(tasks // 10, 1))):
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump({email: [{"id": f"{u:06x}{t:06x}", "text": f"Задача {t}", "completed": t % 3 == 0,
+                                "created_at": "2024-01-01 12:00:00", "due_date": "2024-02-01"}
+                               for t in range(count)]
+                       for u, email in enumerate(emails)}, f, ensure_ascii=False, indent=4)
+
+
+def measure(storage_class) -> tuple:
+    """(запуск, первый вход и список задач) в миллисекундах"""
+    gc.collect()
+    start = time.perf_counter()
+    manager = UserManager(storage_class(DB_FILE, TASKS_FILE, TRASH_FILE))
+    started = time.perf_counter()
+    user = manager.login_user("user1@example.com", "secret")
+    assert user is not None and manager.get_tasks(user.email, limit=50)
+    finished = time.perf_counter()
+    return (started - start) * 1000, (finished - started) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--tasks", type=int, default=20, help="задач на пользователя")
+    args = parser.parse_args()
+
+    make_files(args.users, args.tasks)
+    size = sum(os.path.getsize(name) for name in (DB_FILE, TASKS_FILE, TRASH_FILE)) / 2 ** 20
+    print(f"пользователей: {args.users}, задач: {args.users * args.tasks}, файлы: {size:.1f} МБ")
+    # Первый ленивый запуск читает файлы целиком и сохраняет индекс смещений
+    JsonStorage(DB_FILE, TASKS_FILE, TRASH_FILE).load()
+
+    print(f"{'загрузка':>10} {'запуск, мс':>12} {'первый запрос, мс':>18}")
+    for name, storage_class in (("полная", EagerJsonStorage), ("ленивая", JsonStorage)):
+        startup, first_request = measure(storage_class)
+        print(f"{name:>10} {startup:>12.1f} {first_request:>18.1f}")
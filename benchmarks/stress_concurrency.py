@@ -0,0 +1,114 @@
+"""Нагрузочная проверка UserManager из многих потоков и процессов.
+
+Каждый процесс создаёт свой UserManager над общими файлами, его потоки
+добавляют задачи и отмечают их выполненными. В конце проверяется, что
+ни одна задача не потерялась — и в менеджере, созданном до запуска
+процессов, и в только что загруженном.
+
+grouped — json с отложенной групповой записью (flush_interval).
+
+Запуск: python benchmarks/stress_concurrency.py [json binary grouped journal sharded sqlite] [--processes 4] [--threads 8] [--ops 50]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+USERS = 5
+
+
+def make_storage(backend: str):
+    import app
+    from storage import JournaledJsonStorage, ShardedJsonStorage, SqliteStorage, JsonStorage
+    if backend == "sqlite":
+        return SqliteStorage(app.SQLITE_FILE)
+    if backend == "journal":
+        # Маленький порог, чтобы журнал сворачивался прямо во время проверки
+        return JournaledJsonStorage(app.DB_FILE, app.TASKS_FILE, app.TRASH_FILE, app.JOURNAL_FILE,
+                                    compact_threshold=16 * 1024)
+    if backend == "sharded":
+        # Меньше пользователей в памяти, чем всего: выгрузка тоже под нагрузкой
+        return ShardedJsonStorage(app.DB_FILE, app.SHARDS_DIR, USERS - 2)
+    if backend == "binary":
+        return JsonStorage(app.DB_FILE, app.TASKS_SNAPSHOT, app.TRASH_SNAPSHOT, binary=True)
+    if backend == "grouped":
+        return JsonStorage(app.DB_FILE, app.TASKS_FILE, app.TRASH_FILE, flush_interval=0.02, durability="file")
+    return JsonStorage(app.DB_FILE, app.TASKS_FILE, app.TRASH_FILE)
+
+
+def worker(backend: str, directory: str, number: int, threads: int, ops: int):
+    """Возвращает [(email, id)] добавленных и отмеченных задач"""
+    os.chdir(directory)
+    from app import UserManager
+    manager = UserManager(make_storage(backend))
+    done = []
+
+    def run(thread: int):
+        for i in range(ops):
+            email = f"user{random.randrange(USERS)}@example.com"
+            task = manager.add_task(email, f"p{number}-t{thread}-{i}")
+            assert manager.toggle_task_status(email, task.id)
+            done.append((email, task.id))
+
+    pool = [threading.Thread(target=run, args=(thread,)) for thread in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    if backend == "grouped":
+        # Процессы пула завершаются без atexit: отложенные изменения сохраняются явно
+        manager.storage.close()
+    return done
+
+
+def check(manager, done) -> int:
+    """Число потерянных или не отмеченных задач"""
+    lost = 0
+    for email, task_id in done:
+        task = manager.get_task(email, task_id)
+        if task is None or not task.completed:
+            lost += 1
+    return lost
+
+
+def stress(backend: str, processes: int, threads: int, ops: int) -> bool:
+    directory = tempfile.mkdtemp()
+    os.chdir(directory)
+    from app import UserManager
+    live = UserManager(make_storage(backend))
+    for i in range(USERS):
+        live.register_user({"name": f"Пользователь {i}", "email": f"user{i}@example.com",
+                            "phone": f"8{i:010d}", "password": "secret"})
+
+    start = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(processes) as pool:
+        results = pool.starmap(worker, [(backend, directory, number, threads, ops) for number in range(processes)])
+    elapsed = time.perf_counter() - start
+    done = [item for result in results for item in result]
+
+    lost_live = check(live, done)
+    lost_fresh = check(UserManager(make_storage(backend)), done)
+    ok = len(done) == processes * threads * ops and lost_live == 0 and lost_fresh == 0
+    print(f"{backend:>8} {len(done):>8} {len(done) / elapsed:>10.0f} {lost_live:>10} {lost_fresh:>10}  "
+          f"{'OK' if ok else 'FAILED'}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("backends", nargs="*", default=["json", "binary", "grouped", "journal", "sharded", "sqlite"])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'хранилище':>8} {'задач':>8} {'задач/с':>10} {'потеряно':>10} {'после загр.':>10}")
+    results = [stress(backend, args.processes, args.threads, args.ops) for backend in args.backends]
+    sys.exit(0 if all(results) else 1)
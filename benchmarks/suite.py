@@ -0,0 +1,280 @@
+"""Набор замеров: UserManager, страницы Flask и консольный UserManagement на синтетических данных.
+
+Данные создаются заново при каждом запуске и зависят только от параметров
+и --seed, поэтому замеры разных коммитов можно сравнивать между собой:
+--json сохраняет результаты в файл, --compare сравнивает с сохранёнными
+и завершается с кодом 1, если какая-то операция замедлилась больше, чем
+на --threshold.
+
+Замеряются:
+  manager.*  — методы UserManager напрямую, вместе с записью в хранилище;
+  http.*     — маршруты Flask через тестовый клиент;
+  cli.*      — методы UserManagement из main.py с подставленным input().
+
+Запуск: python benchmarks/suite.py [--users 1000] [--tasks 20] [--trash 2]
+        [--due-share 0.5] [--due-spread 14] [--backend json] [--repeat 100]
+        [--seed 1] [--json results.json] [--compare old.json]
+"""
+import argparse
+import builtins
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager, redirect_stdout
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "app"))
+sys.path.insert(0, ROOT)
+
+# app.py при импорте создаёт UserManager над этими файлами в текущей папке,
+# поэтому данные пишутся до импорта
+DB_FILE = "users.json"
+TASKS_FILE = "users_tasks.json"
+TRASH_FILE = "users_trash.json"
+
+BACKENDS = ("json", "binary", "journal", "sharded", "sqlite")
+FILTERS = ("all", "active", "completed", "urgent", "overdue", "search")
+WORDS = ("купить", "позвонить", "отчёт", "встреча", "ёлка", "молоко", "проект", "оплатить",
+         "письмо", "врач", "билеты", "ремонт", "подарок", "код", "тесты", "релиз")
+
+
+def make_dataset(args, rng: random.Random):
+    """Пользователи и {email: [task, ...]} задач и корзины в формате JSON-файлов"""
+    today = date.today()
+    created = datetime.now().replace(microsecond=0)
+
+    def make_task(task_id: str) -> dict:
+        due_date = None
+        if rng.random() < args.due_share:
+            due_date = (today + timedelta(days=rng.randint(-args.due_spread, args.due_spread))).isoformat()
+        return {"id": task_id, "text": " ".join(rng.choice(WORDS) for _ in range(3)),
+                "completed": rng.random() < 0.3,
+                "created_at": (created - timedelta(minutes=rng.randrange(100000))).isoformat(" "),
+                "due_date": due_date}
+
+    users = [{"name": f"Пользователь {u}", "email": f"user{u}@example.com", "phone": f"8{u:010d}",
+              "password": "secret"} for u in range(args.users)]
+    tasks = {user["email"]: [make_task(f"{u:06x}{t:06x}") for t in range(args.tasks)]
+             for u, user in enumerate(users)}
+    trash = {user["email"]: [make_task(f"{u:06x}f{t:05x}") for t in range(args.trash)]
+             for u, user in enumerate(users)}
+    return users, tasks, trash
+
+
+def write_dataset(backend: str, users, tasks, trash):
+    """Файлы данных в текущей папке под именами из app.py; переменные окружения выбирают хранилище"""
+    for filename, data in ((DB_FILE, users), (TASKS_FILE, tasks), (TRASH_FILE, trash)):
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+    os.environ["STORAGE_BACKEND"] = "json" if backend == "binary" else backend
+    os.environ["SNAPSHOT_FORMAT"] = "binary" if backend == "binary" else "json"
+    if backend == "binary":
+        from snapshot import save_snapshot
+        save_snapshot(tasks, "users_tasks.bin")
+        save_snapshot(trash, "users_trash.bin")
+    elif backend == "sqlite":
+        from storage import migrate_json_to_sqlite
+        migrate_json_to_sqlite(DB_FILE, TASKS_FILE, TRASH_FILE, "users.db")
+
+
+class Results:
+    def __init__(self, repeat: int):
+        self.repeat = repeat
+        self.rows = {}
+
+    def measure(self, name: str, func, setup=None, repeat: int = None):
+        """Время func(*setup(i)) для i = 0..repeat-1; setup в замер не входит"""
+        times = []
+        for i in range(repeat or self.repeat):
+            args = setup(i) if setup else ()
+            start = time.perf_counter_ns()
+            func(*args)
+            times.append(time.perf_counter_ns() - start)
+        times.sort()
+        row = self.rows[name] = {
+            "n": len(times),
+            "mean_us": sum(times) / len(times) / 1000,
+            "p50_us": times[len(times) // 2] / 1000,
+            "p95_us": times[min(len(times) - 1, len(times) * 95 // 100)] / 1000,
+            "min_us": times[0] / 1000,
+        }
+        print(f"{name:<40} {row['n']:>6} {row['p50_us']:>12.1f} {row['p95_us']:>12.1f} {row['mean_us']:>12.1f}")
+
+
+def bench_manager(results: Results, manager, args, rng: random.Random):
+    emails = [f"user{u}@example.com" for u in range(args.users)]
+
+    def some_task(email: str) -> str:
+        return rng.choice(manager.get_tasks(email)).id
+
+    def task_setup(i):
+        email = rng.choice(emails)
+        return email, some_task(email)
+
+    results.measure("manager.register_user", manager.register_user, lambda i: ({
+        "name": "Новый", "email": f"new{i}@example.com", "phone": f"+7{9000000000 + i}", "password": "secret"},))
+    results.measure("manager.login_user", manager.login_user,
+                    lambda i: (rng.choice(emails) if i % 2 else f"8{rng.randrange(args.users):010d}", "secret"))
+    results.measure("manager.add_task", manager.add_task,
+                    lambda i: (rng.choice(emails), f"{rng.choice(WORDS)} {i}", (date.today() + timedelta(days=i % 7)).isoformat()))
+    for filter_type in FILTERS:
+        results.measure(f"manager.get_tasks[{filter_type}]", manager.get_tasks,
+                        lambda i: (rng.choice(emails), filter_type, 50, None, rng.choice(WORDS)[:3]))
+    results.measure("manager.get_counts", manager.get_counts, lambda i: (rng.choice(emails),))
+    results.measure("manager.toggle_task_status", manager.toggle_task_status, task_setup)
+    deleted = []
+
+    def delete_setup(i):
+        deleted.append(task_setup(i))
+        return deleted[-1]
+
+    results.measure("manager.delete_task", manager.delete_task, delete_setup)
+    results.measure("manager.restore_task", manager.restore_task, lambda i: deleted[i])
+    results.measure("manager.get_trash", manager.get_trash, lambda i: (rng.choice(emails), 50))
+    results.measure("manager.empty_trash", manager.empty_trash, lambda i: (emails[i % len(emails)],),
+                    repeat=min(results.repeat, len(emails)))
+
+
+def bench_http(results: Results, app_module, args, rng: random.Random):
+    client = app_module.app.test_client()
+    email = "user0@example.com"
+    client.post("/login", data={"email_or_phone": email, "password": "secret"})
+    client.get("/tasks")  # показывает сообщение о входе
+
+    results.measure("http.POST /login", lambda: client.post(
+        "/login", data={"email_or_phone": f"user{rng.randrange(args.users)}@example.com", "password": "secret"}))
+    client.post("/login", data={"email_or_phone": email, "password": "secret"})
+    client.get("/tasks")
+    for filter_type in FILTERS:
+        results.measure(f"http.GET /tasks?filter={filter_type}", lambda: client.get(
+            "/tasks", query_string={"filter": filter_type, "q": rng.choice(WORDS)[:3]}))
+    etag = client.get("/tasks").headers["ETag"]
+    results.measure("http.GET /tasks (304)", lambda: client.get("/tasks", headers={"If-None-Match": etag}))
+    results.measure("http.GET /trash", lambda: client.get("/trash"))
+    results.measure("http.POST /tasks (add)", lambda: client.post(
+        "/tasks", data={"task_text": rng.choice(WORDS), "due_date": ""}))
+    task_ids = [task.id for task in app_module.user_manager.get_tasks(email)]
+    results.measure("http.POST /tasks (toggle)", lambda: client.post(
+        "/tasks", data={"toggle_task": rng.choice(task_ids)}))
+    client.get("/tasks")
+    results.measure("http.GET /api/v1/tasks", lambda: client.get("/api/v1/tasks"))
+    results.measure("http.POST /api/v1/batch (10 ops)", lambda: client.post("/api/v1/batch", json={
+        "operations": [{"op": "toggle", "id": rng.choice(task_ids)} for _ in range(10)]}))
+
+
+@contextmanager
+def scripted_input(answers):
+    """input() возвращает answers по очереди, вывод программы отбрасывается"""
+    answers = iter(answers)
+    original = builtins.input
+    builtins.input = lambda prompt="": next(answers)
+    try:
+        with redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        builtins.input = original
+
+
+def bench_cli(results: Results, args, rng: random.Random):
+    from main import UserManagement
+    repeat = args.cli_repeat
+
+    def run(method, *answers):
+        with scripted_input(answers):
+            method()
+
+    def startup_and_login(i):
+        cli = UserManagement()
+        run(cli.login, f"user{i % args.users}@example.com", "secret")
+
+    results.measure("cli.startup + login", startup_and_login, lambda i: (i,), repeat=repeat)
+    cli = UserManagement()
+    run(cli.login, "user1@example.com", "secret")
+    results.measure("cli.login", lambda: run(cli.login, f"user{rng.randrange(args.users)}@example.com", "secret"),
+                    repeat=repeat)
+    results.measure("cli.sign_up", lambda i: run(cli.sign_up, "Новый", f"cli{i}@example.com",
+                                                 f"+7{8000000000 + i}", "secret"),
+                    lambda i: (i,), repeat=repeat)
+    run(cli.login, "user1@example.com", "secret")
+    results.measure("cli.add_task", lambda: run(cli.add_task, rng.choice(WORDS)), repeat=repeat)
+    results.measure("cli.show_tasks[all]", lambda: run(cli.show_tasks, "1", "0", "0"), repeat=repeat)
+    results.measure("cli.show_tasks[active]", lambda: run(cli.show_tasks, "2", "0", "0"), repeat=repeat)
+    results.measure("cli.show_tasks[search]", lambda: run(cli.show_tasks, "4", rng.choice(WORDS)[:3], "0", "0"),
+                    repeat=repeat)
+    results.measure("cli.toggle_task_status", lambda: run(cli.show_tasks, "1", "1", "1", "0"), repeat=repeat)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(rows: dict, baseline_file: str, threshold: float) -> bool:
+    """Печатает изменение медианы относительно baseline_file; False — есть замедления"""
+    with open(baseline_file, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nСравнение с {baseline_file} ({baseline['meta'].get('commit') or 'без коммита'}):")
+    ok = True
+    for name, row in rows.items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        ratio = row["p50_us"] / old["p50_us"] if old["p50_us"] else 1.0
+        slower = ratio > 1 + threshold
+        ok = ok and not slower
+        print(f"{name:<40} {old['p50_us']:>12.1f} → {row['p50_us']:>12.1f}  x{ratio:.2f}"
+              f"{'  ЗАМЕДЛЕНИЕ' if slower else ''}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--tasks", type=int, default=20, help="задач на пользователя")
+    parser.add_argument("--trash", type=int, default=2, help="задач в корзине на пользователя")
+    parser.add_argument("--due-share", type=float, default=0.5, help="доля задач со сроком")
+    parser.add_argument("--due-spread", type=int, default=14, help="срок: сегодня ± столько дней")
+    parser.add_argument("--backend", choices=BACKENDS, default="json")
+    parser.add_argument("--repeat", type=int, default=100, help="повторов каждой операции")
+    parser.add_argument("--cli-repeat", type=int, default=10, help="повторов для консольной версии")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    parser.add_argument("--compare", help="сравнить с результатами из файла")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимое замедление медианы")
+    args = parser.parse_args()
+
+    # Пути к файлам результатов — относительно папки запуска, данные — во временной папке
+    for name in ("json", "compare"):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+    os.chdir(tempfile.mkdtemp())
+    rng = random.Random(args.seed)
+    write_dataset(args.backend, *make_dataset(args, rng))
+    import app as app_module  # создаёт UserManager над файлами из текущей папки
+
+    print(f"хранилище: {args.backend}, пользователей: {args.users}, задач: {args.users * args.tasks}, "
+          f"в корзине: {args.users * args.trash}")
+    print(f"{'операция':<40} {'n':>6} {'p50, мкс':>12} {'p95, мкс':>12} {'среднее, мкс':>12}")
+    results = Results(args.repeat)
+    bench_manager(results, app_module.user_manager, args, rng)
+    bench_http(results, app_module, args, rng)
+    bench_cli(results, args, rng)
+
+    if args.json:
+        meta = {"commit": git_commit(), "python": platform.python_version(),
+                "date": datetime.now().isoformat(timespec="seconds"),
+                "params": {key: value for key, value in vars(args).items() if key not in ("json", "compare")}}
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "results": results.rows}, f, ensure_ascii=False, indent=4)
+    if args.compare and not compare(results.rows, args.compare, args.threshold):
+        sys.exit(1)
@@ -1,48 +1,42 @@
-import json
+"""Консольный менеджер задач.
+
+И интерактивное меню (без аргументов), и команды работают через UserManager
+приложения (app/app.py): хранилище то же, что у сайта (STORAGE_BACKEND
+и остальные переменные окружения), с теми же блокировками, а удалённые
+задачи, как и на сайте, попадают в корзину. Команды выполняются без вопросов,
+все их операции сохраняются один раз в конце внутри UserManager.batch():
+
+    python main.py --user EMAIL add "текст" ["текст" ...]   — печатает id новых задач
+    python main.py --user EMAIL list [--filter active|completed] [--search слова]
+    python main.py --user EMAIL toggle ID [ID ...]
+    python main.py --user EMAIL delete ID [ID ...]
+    python main.py --user EMAIL run < операции
+
+run читает со стандартного ввода по операции в строке: "add <текст>",
+"toggle <id>" или "delete <id>"; пустые строки и строки с # пропускаются.
+Вместо email можно указать телефон. Пароль не спрашивается: команды
+предназначены для обслуживания, у которого и так есть доступ к файлам.
+"""
+import argparse
 import os
 import re
-from typing import List, Dict, Union
-from datetime import datetime
+import sys
+from typing import Iterable, Iterator, List, Union
 
-class UserManagement:
-    def __init__(self):
-        self.DB_FILE = "users.json"
-        self.TASKS_FILE = "users_tasks.json"
-        self.users: List[Dict[str, str]] = self._load_users()
-        self.tasks: Dict[str, List[Dict[str, Union[str, bool]]]] = self._load_tasks()
-        self.current_user: Union[Dict[str, str], None] = None
-
-    def _load_users(self) -> List[Dict[str, str]]:
-        if not os.path.exists(self.DB_FILE):
-            with open(self.DB_FILE, "w", encoding="utf-8") as file:
-                json.dump([], file)
-            return []
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+from records import Task, User  # noqa: E402
 
-        try:
-            with open(self.DB_FILE, "r", encoding="utf-8") as file:
-                return json.load(file)
-        except (json.JSONDecodeError, FileNotFoundError):
-            return []
+LIST_PAGE_SIZE = 1000  # задач за одно обращение к UserManager при выводе списка
 
-    def _load_tasks(self) -> Dict[str, List[Dict[str, Union[str, bool]]]]:
-        if not os.path.exists(self.TASKS_FILE):
-            with open(self.TASKS_FILE, "w", encoding="utf-8") as file:
-                json.dump({}, file)
-            return {}
-
-        try:
-            with open(self.TASKS_FILE, "r", encoding="utf-8") as file:
-                return json.load(file)
-        except (json.JSONDecodeError, FileNotFoundError):
-            return {}
-
-    def _save_users(self):
-        with open(self.DB_FILE, "w", encoding="utf-8") as file:
-            json.dump(self.users, file, ensure_ascii=False, indent=4)
+class UserManagement:
+    def __init__(self):
+        self.current_user: Union[User, None] = None
 
-    def _save_tasks(self):
-        with open(self.TASKS_FILE, "w", encoding="utf-8") as file:
-            json.dump(self.tasks, file, ensure_ascii=False, indent=4)
+    @property
+    def user_manager(self):
+        """UserManager приложения; импортируется при первом обращении, чтобы меню появлялось сразу"""
+        from app import user_manager
+        return user_manager
 
     def _get_valid_input(self, prompt: str, validator) -> str:
         while True:
@@ -73,7 +67,7 @@ class UserManagement:
             print("Некорректный выбор.")
 
     def _show_user_menu(self):
-        print(f"\nДобро пожаловать, {self.current_user['name']}!")
+        print(f"\nДобро пожаловать, {self.current_user.name}!")
         print("Выберите действие:")
         print("1. Добавить задачу")
         print("2. Показать мои задачи")
@@ -97,22 +91,24 @@ class UserManagement:
 
     def sign_up(self):
         print("\nРегистрация")
-        user = {
-            "name": self._get_valid_input("Введите имя: ", self._is_name_valid),
-            "email": self._get_valid_input("Введите email: ", self._is_email_valid),
-            "phone": self._get_valid_input("Введите телефон: ", self._is_phone_valid),
-            "password": self._get_valid_input("Введите пароль: ", self._is_password_valid),
-        }
-
-        if any(u["email"] == user["email"] for u in self.users):
+        user = User(
+            self._get_valid_input("Введите имя: ", self._is_name_valid),
+            self._get_valid_input("Введите email: ", self._is_email_valid),
+            self._get_valid_input("Введите телефон: ", self._is_phone_valid),
+            self._get_valid_input("Введите пароль: ", self._is_password_valid),
+        )
+
+        if self.user_manager.find_user(user.email) is not None:
             print("❌ Ошибка: Пользователь с таким email уже существует!")
             return
-        if any(u["phone"] == user["phone"] for u in self.users):
+        if self.user_manager.find_user(user.phone) is not None:
             print("❌ Ошибка: Пользователь с таким телефоном уже существует!")
             return
-
-        self.users.append(user)
-        self._save_users()
+        # register_user проверяет занятость ещё раз под блокировкой записи:
+        # пользователя могли зарегистрировать на сайте сразу после проверки выше
+        if not self.user_manager.register_user(user.to_dict()):
+            print("❌ Ошибка: Пользователь с таким email или телефоном уже существует!")
+            return
         print("✅ Регистрация прошла успешно!")
 
     def login(self):
@@ -120,16 +116,13 @@ class UserManagement:
         email_or_phone = input("Введите email или телефон: ").strip()
         password = input("Введите пароль: ").strip()
 
-        for user in self.users:
-            if (user["email"] == email_or_phone or user["phone"] == email_or_phone) and user["password"] == password:
-                print(f"✅ Вход выполнен! Добро пожаловать, {user['name']}!")
-                self.current_user = user
-                if user['email'] not in self.tasks:
-                    self.tasks[user['email']] = []
-                    self._save_tasks()
-                return
+        user = self.user_manager.login_user(email_or_phone, password)
+        if user is None:
+            print("❌ Ошибка: Неверный email/телефон или пароль.")
+            return
 
-        print("❌ Ошибка: Неверный email/телефон или пароль.")
+        print(f"✅ Вход выполнен! Добро пожаловать, {user.name}!")
+        self.current_user = user
 
     def add_task(self):
         if not self.current_user:
@@ -138,23 +131,12 @@ class UserManagement:
 
         print("\nДобавление новой задачи")
         task_text = input("Введите текст задачи: ").strip()
-        
+
         if not task_text:
             print("Текст задачи не может быть пустым!")
             return
-        
-        new_task = {
-            "text": task_text,
-            "completed": False,
-            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-        
-        user_email = self.current_user['email']
-        if user_email not in self.tasks:
-            self.tasks[user_email] = []
-        
-        self.tasks[user_email].append(new_task)
-        self._save_tasks()
+
+        self.user_manager.add_task(self.current_user.email, task_text)
         print("✅ Задача успешно добавлена!")
 
     def show_tasks(self):
@@ -162,8 +144,8 @@ class UserManagement:
             print("Ошибка: пользователь не авторизован")
             return
 
-        user_email = self.current_user['email']
-        if user_email not in self.tasks or not self.tasks[user_email]:
+        user_email = self.current_user.email
+        if not self.user_manager.get_tasks(user_email, "all", 1):
             print("У вас пока нет задач.")
             return
 
@@ -172,42 +154,48 @@ class UserManagement:
             print("1. Все задачи")
             print("2. Только активные")
             print("3. Только выполненные")
+            print("4. Поиск")
             print("0. Вернуться в меню")
-            
-            filter_choice = input("Выберите действие (0-3): ").strip()
-            
+
+            filter_choice = input("Выберите действие (0-4): ").strip()
+
             if filter_choice == "0":
                 break
-                
-            tasks_to_show = []
+
             if filter_choice == "1":
-                tasks_to_show = self.tasks[user_email]
+                found = self._list_tasks(self.user_manager, user_email, "all")
                 print("\nВсе задачи:")
             elif filter_choice == "2":
-                tasks_to_show = [task for task in self.tasks[user_email] if not task['completed']]
+                found = self._list_tasks(self.user_manager, user_email, "active")
                 print("\nАктивные задачи:")
             elif filter_choice == "3":
-                tasks_to_show = [task for task in self.tasks[user_email] if task['completed']]
+                found = self._list_tasks(self.user_manager, user_email, "completed")
                 print("\nВыполненные задачи:")
+            elif filter_choice == "4":
+                query = input("Введите слова для поиска: ").strip()
+                found = self._list_tasks(self.user_manager, user_email, "all", query)
+                print(f"\nНайденные задачи ({query}):")
             else:
                 print("Некорректный выбор, попробуйте еще раз.")
                 continue
 
+            # Номера нужны, чтобы потом выбрать задачу, поэтому показанные задачи запоминаются
+            tasks_to_show = []
+            for task in found:
+                tasks_to_show.append(task)
+                print(f"{len(tasks_to_show)}. {self._format_task(task)}")
+
             if not tasks_to_show:
                 print("Нет задач для отображения.")
                 continue
 
-            for i, task in enumerate(tasks_to_show, 1):
-                status = "✓" if task['completed'] else "✗"
-                print(f"{i}. [{status}] {task['text']} (добавлено: {task.get('created_at', 'неизвестно')})")
-
             print("\nВыберите действие:")
             print("1. Изменить статус задачи")
             print("2. Удалить задачу")
             print("0. Вернуться к фильтрам")
-            
+
             action_choice = input().strip()
-            
+
             if action_choice == "1":
                 self._toggle_task_status(user_email, tasks_to_show)
             elif action_choice == "2":
@@ -217,37 +205,121 @@ class UserManagement:
             else:
                 print("Некорректный выбор.")
 
-    def _toggle_task_status(self, user_email: str, tasks_to_show: List[Dict]):
+    def _toggle_task_status(self, user_email: str, tasks_to_show: List[Task]):
         try:
             task_num = int(input("Введите номер задачи для изменения статуса: ").strip())
             if 1 <= task_num <= len(tasks_to_show):
-                
-                task_text = tasks_to_show[task_num - 1]['text']
-                for task in self.tasks[user_email]:
-                    if task['text'] == task_text:
-                        task['completed'] = not task['completed']
-                        self._save_tasks()
-                        print(f"Статус задачи '{task['text']}' изменен на {'✓' if task['completed'] else '✗'}")
-                        break
+                task_id = tasks_to_show[task_num - 1].id
+                task = None
+                if self.user_manager.toggle_task_status(user_email, task_id):
+                    task = self.user_manager.get_task(user_email, task_id)
+                if task is None:
+                    # Задачу успели удалить, например на сайте
+                    print("Задача не найдена.")
+                    return
+                print(f"Статус задачи '{task.text}' изменен на {'✓' if task.completed else '✗'}")
             else:
                 print("Неверный номер задачи.")
         except ValueError:
             print("Пожалуйста, введите число.")
 
-    def _delete_task(self, user_email: str, tasks_to_show: List[Dict]):
+    def _delete_task(self, user_email: str, tasks_to_show: List[Task]):
         try:
             task_num = int(input("Введите номер задачи для удаления: ").strip())
             if 1 <= task_num <= len(tasks_to_show):
-                task_text = tasks_to_show[task_num - 1]['text']
-                
-                self.tasks[user_email] = [task for task in self.tasks[user_email] if task['text'] != task_text]
-                self._save_tasks()
-                print(f"Задача '{task_text}' удалена.")
+                task = tasks_to_show[task_num - 1]
+                if not self.user_manager.delete_task(user_email, task.id):
+                    print("Задача не найдена.")
+                    return
+                print(f"Задача '{task.text}' перенесена в корзину.")
             else:
                 print("Неверный номер задачи.")
         except ValueError:
             print("Пожалуйста, введите число.")
 
+    def _format_task(self, task: Task) -> str:
+        status = "✓" if task.completed else "✗"
+        return f"[{status}] {task.text} (добавлено: {task.created_at or 'неизвестно'})"
+
+    def run_command(self, argv: List[str]) -> int:
+        """Выполняет команду без интерактивного меню; возвращает код выхода"""
+        parser = argparse.ArgumentParser(prog="main.py", description="Задачи пользователя без интерактивного меню")
+        parser.add_argument("--user", required=True, help="email или телефон пользователя")
+        commands = parser.add_subparsers(dest="command", required=True)
+        commands.add_parser("add", help="добавить задачи").add_argument("texts", nargs="+", metavar="текст")
+        list_parser = commands.add_parser("list", help="показать задачи")
+        list_parser.add_argument("--filter", choices=("all", "active", "completed"), default="all")
+        list_parser.add_argument("--search", help="слова для поиска")
+        commands.add_parser("toggle", help="изменить статус задач").add_argument("ids", nargs="+", metavar="id")
+        commands.add_parser("delete", help="удалить задачи").add_argument("ids", nargs="+", metavar="id")
+        commands.add_parser("run", help="операции со стандартного ввода")
+        args = parser.parse_args(argv)
+
+        user_manager = self.user_manager
+        user = user_manager.find_user(args.user)
+        if user is None:
+            print(f"❌ Ошибка: пользователь {args.user} не найден.", file=sys.stderr)
+            return 1
+        if args.command == "list":
+            for task in self._list_tasks(user_manager, user.email, args.filter, args.search):
+                print(f"{task.id} {self._format_task(task)}")
+            return 0
+        if args.command == "add":
+            operations = (("add", text, None) for text in args.texts)
+        elif args.command in ("toggle", "delete"):
+            operations = ((args.command, task_id, None) for task_id in args.ids)
+        else:
+            operations = self._read_operations(sys.stdin)
+        return self._apply_operations(user_manager, user.email, operations)
+
+    def _list_tasks(self, user_manager, user_email: str, filter_type: str, query: str = None) -> Iterator[Task]:
+        """Задачи по фильтру или поиску страницами по LIST_PAGE_SIZE, без списка всех задач"""
+        if query:
+            filter_type = "search"
+        cursor = None
+        while True:
+            page = user_manager.get_tasks(user_email, filter_type, LIST_PAGE_SIZE, cursor, query)
+            yield from page
+            if len(page) < LIST_PAGE_SIZE:
+                return
+            cursor = user_manager.task_cursor(user_email, filter_type, page[-1])
+
+    def _read_operations(self, lines: Iterable[str]) -> Iterator[tuple]:
+        """(операция, аргумент, номер строки) — по одной, по мере чтения"""
+        for line_no, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            operation, _, argument = line.partition(" ")
+            yield operation, argument.strip(), line_no
+
+    def _apply_operations(self, user_manager, user_email: str, operations: Iterable[tuple]) -> int:
+        """Применяет операции и сохраняет их хранилищем один раз в конце"""
+        counts = {"add": 0, "toggle": 0, "delete": 0}
+        errors = 0
+        with user_manager.batch():
+            for operation, argument, line_no in operations:
+                where = f"строка {line_no}: " if line_no else ""
+                if operation not in counts:
+                    print(f"❌ {where}неизвестная операция {operation!r}", file=sys.stderr)
+                    errors += 1
+                elif not argument:
+                    print(f"❌ {where}у операции {operation} нет аргумента", file=sys.stderr)
+                    errors += 1
+                elif operation == "add":
+                    print(user_manager.add_task(user_email, argument).id)
+                    counts["add"] += 1
+                else:
+                    apply = user_manager.toggle_task_status if operation == "toggle" else user_manager.delete_task
+                    if not apply(user_email, argument):
+                        print(f"❌ {where}задача {argument} не найдена", file=sys.stderr)
+                        errors += 1
+                    else:
+                        counts[operation] += 1
+        print(f"✅ Добавлено: {counts['add']}, изменён статус: {counts['toggle']}, "
+              f"в корзину: {counts['delete']}", file=sys.stderr)
+        return 1 if errors else 0
+
     def _is_email_valid(self, email: str) -> bool:
         return re.match(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9-]+\.[a-zA-Z]{2,}$", email) is not None
 
@@ -263,4 +335,6 @@ class UserManagement:
 
 if __name__ == "__main__":
     manager = UserManagement()
+    if len(sys.argv) > 1:
+        sys.exit(manager.run_command(sys.argv[1:]))
     manager.start()
\ No newline at end of file